@@ -6,7 +6,24 @@ OpenClaw Sync Script
 支持通过 cronjob 调用。合并成功后通过 Telegram Bot 发送通知。
 
 Usage:
-    python scripts/openclaw_sync.py [--config CONFIG_PATH] [--dry-run] [--no-merge]
+    python scripts/openclaw_sync.py [--config CONFIG_PATH] [--dry-run] [--no-merge] [--precheck]
+    python scripts/openclaw_sync.py --watch [--debounce SECONDS]
+    python scripts/openclaw_sync.py --stats
+
+    同一时间只有一个实例在同步（<log_dir>/openclaw_sync.lock 上的 flock）。
+    cron 在上一次运行尚未结束时再次触发，只会登记一次重跑请求后立即退出，
+    正在运行的实例结束后再补跑一轮：一串触发最多合并成一轮额外同步。
+
+    每一步（提交 → 推送 → 开 PR → 合并 → 通知）完成后记入 <log_dir>/openclaw_sync_journal.json；
+    中途崩溃或推送/合并失败后，下次运行沿用同一分支与 PR 从断点继续。
+    自动合并失败期间，之后运行的新变更追加为该分支上的提交，每次运行都重试合并并发送告警。
+
+    --precheck  先只做 stat 比对：与上次未发现变更的运行留下的快照一致时，
+                不导入 loguru/yaml/requests 直接退出（毫秒级）。
+    --watch     常驻进程，用 inotify 监听 source_dir 与同步项，变更静默
+                debounce 秒后把这一批合并为一次 同步 → 提交 → PR。
+    --stats     汇总运行历史（logs/openclaw_sync_history.jsonl）：
+                运行耗时、读取/复制字节数的 p50/p95 及按周趋势。
 
 Requirements:
     - loguru  (logging)
@@ -14,23 +31,48 @@ Requirements:
     - requests (Telegram notification)
     - gh CLI  (GitHub operations)
     - git
+
+loguru / yaml / requests 均延迟到真正需要时才导入。
 """
 
 from __future__ import annotations
 
+import time
+
+_STARTUP_T0 = time.perf_counter()
+
 import argparse
+import errno
+import functools
 import hashlib
+import json
+import math
 import os
+import re
 import shutil
 import subprocess
 import sys
+import threading
+from concurrent.futures import Executor, ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
 from pathlib import Path
-from typing import Any
+from stat import S_ISDIR, S_ISREG, S_IXUSR
+from typing import Any, Callable, Container, Iterable, Iterator, NamedTuple
+
+
+class _LazyLogger:
+    """首次使用时才导入 loguru，并把模块级 logger 替换为真正的 loguru logger。"""
 
-import requests
-import yaml
-from loguru import logger
+    def __getattr__(self, name: str) -> Any:
+        global logger
+        from loguru import logger as _logger
+
+        logger = _logger
+        return getattr(_logger, name)
+
+
+logger: Any = _LazyLogger()
 
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -41,6 +83,61 @@ DEFAULT_CONFIG_FILE = "configs/openclaw_sync.yaml"
 SCRIPT_DIR = Path(__file__).parent.resolve()
 PROJECT_ROOT = SCRIPT_DIR.parent.resolve()
 
+# 持久化哈希清单：(path, size, mtime_ns, inode) → digest，与日志放在同一目录
+MANIFEST_FILE = "openclaw_sync_manifest.json"
+MANIFEST_VERSION = 2  # v2: 文件摘要改为 git blob SHA-1
+# mtime 距离哈希时刻过近的文件不写入清单：同一时间粒度内的再次写入无法通过 stat 识别
+RACY_WINDOW_NS = 2_000_000_000
+
+# 哈希读取块大小；hashlib 在处理大块数据时释放 GIL，线程池才能真正并行
+HASH_CHUNK_SIZE = 1024 * 1024
+# 空目录的 git 树 ID（git 不记录空目录，calculate_dir_hash 对空目录返回此值）
+EMPTY_TREE_DIGEST = "4b825dc642cb6eb9a060e54bf8d69288fbee4904"
+DEFAULT_WORKERS = min(4, os.cpu_count() or 1)
+
+# 文件复制优先交给内核：FICLONE ioctl（btrfs / XFS 上的 reflink，共享数据块不复制数据）
+FICLONE = 0x40049409
+
+# git / gh 可执行文件：可用环境变量或配置替换，便于对本地 bare 仓库和假 gh 脚本做测试
+GIT_BIN = os.environ.get("OPENCLAW_SYNC_GIT", "git")
+GH_BIN = os.environ.get("OPENCLAW_SYNC_GH", "gh")
+
+# rolling PR 模式默认值
+DEFAULT_ROLLING_BRANCH = "sync/persona-rolling"
+DEFAULT_MERGE_AFTER_HOURS = 24.0
+DEFAULT_MERGE_AFTER_COMMITS = 20
+
+# watch 模式：最后一个事件之后静默多久才触发同步；持续有事件时最长等待多久
+DEFAULT_DEBOUNCE_SECONDS = 5.0
+DEFAULT_MAX_DELAY_SECONDS = 60.0
+
+# stat 预检快照：快速路径需要在解析 YAML 之前找到它，因此位置固定，不随 log_dir 配置变化
+PRECHECK_FILE = PROJECT_ROOT / "logs" / "openclaw_sync_precheck.json"
+PRECHECK_VERSION = 4  # v4: 源端摘要在扫描前取得，与目标端摘要分开保存
+
+# 运行指标：每次运行追加一行 JSON 历史，并重写 Prometheus textfile collector 文件
+HISTORY_FILE = "openclaw_sync_history.jsonl"
+PROM_FILE = "openclaw_sync.prom"
+METRIC_PHASES = ("hash", "copy", "commit", "push", "pr_create", "merge", "notify")
+METRIC_COUNTERS = ("files_stated", "files_hashed", "bytes_read", "bytes_copied", "items_synced")
+
+# Telegram 通知：未送达的消息保存在 <log_dir> 下的 outbox，下次运行补发
+TELEGRAM_API_BASE = "https://api.telegram.org"
+TELEGRAM_OUTBOX_FILE = "openclaw_sync_telegram_outbox.json"
+TELEGRAM_MAX_MESSAGE_LENGTH = 4096
+TELEGRAM_BATCH_SEPARATOR = "\n\n────────────\n\n"
+# 进程退出前最多等待后台发送多久；超时的消息留在 outbox
+TELEGRAM_EXIT_WAIT_SECONDS = 30.0
+
+# 单实例：<log_dir> 下的 flock 锁文件；运行中被再次触发时只留下重跑标记，由当前运行再跑一轮
+LOCK_FILE = "openclaw_sync.lock"
+RERUN_FILE = "openclaw_sync.rerun"
+
+# 流水线日志：记录本次同步走到哪一步，中途崩溃或推送/合并失败后下次运行从断点继续
+JOURNAL_FILE = "openclaw_sync_journal.json"
+JOURNAL_VERSION = 1
+JOURNAL_STAGES = ("hashed", "copied", "committed", "pushed", "pr_opened", "merged", "notified")
+
 
 # ─────────────────────────────────────────────────────────────────────────────
 # Logging Setup
@@ -80,88 +177,1347 @@ def load_config(config_path: Path) -> dict[str, Any]:
     if not config_path.exists():
         raise FileNotFoundError(f"Config file not found: {config_path}")
 
+    import yaml
+
     with open(config_path, "r", encoding="utf-8") as f:
         return yaml.safe_load(f)
 
 
+def get_log_dir(config: dict[str, Any]) -> Path:
+    """返回日志目录（同时存放哈希清单等运行状态文件）。"""
+    return PROJECT_ROOT / config.get("logging", {}).get("log_dir", "logs")
+
+
+def configure_commands(config: dict[str, Any]) -> None:
+    """按配置 git.git_executable / git.gh_executable 覆盖 git、gh 可执行文件路径。"""
+    global GIT_BIN, GH_BIN
+    git_cfg = config.get("git", {})
+    GIT_BIN = git_cfg.get("git_executable") or GIT_BIN
+    GH_BIN = git_cfg.get("gh_executable") or GH_BIN
+
+
+def get_sync_jobs(config: dict[str, Any]) -> list[dict[str, Any]]:
+    """
+    返回同步任务列表，每项含 source_dir / target_subdir / sync_items（SyncItem 列表）。
+    配置了 jobs 时逐项读取（任务未写 sync_items 则继承顶层）；否则顶层配置即唯一任务。
+    """
+    jobs_cfg = config.get("jobs") or [config]
+    jobs = [
+        {
+            "source_dir": job["source_dir"],
+            "target_subdir": job["target_subdir"],
+            "sync_items": [
+                parse_sync_item(spec) for spec in job.get("sync_items", config.get("sync_items", []))
+            ],
+        }
+        for job in jobs_cfg
+    ]
+    targets = [job["target_subdir"] for job in jobs]
+    duplicates = sorted({t for t in targets if targets.count(t) > 1})
+    if duplicates:
+        raise ValueError(f"Duplicate target_subdir in jobs: {', '.join(duplicates)}")
+    return jobs
+
+
+def get_workers(config: dict[str, Any]) -> int:
+    """返回哈希/复制线程池大小（performance.workers，至少为 1）。"""
+    workers = config.get("performance", {}).get("workers") or DEFAULT_WORKERS
+    return max(1, int(workers))
+
+
 # ─────────────────────────────────────────────────────────────────────────────
-# Telegram Notification
+# Sync Item Filters
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _translate_pattern(pattern: str) -> tuple[str, bool]:
+    """
+    把一条 gitignore 风格模式翻译为正则，返回 (正则, 是否取反)。
+    被匹配的路径相对同步项根目录，目录以 "/" 结尾。
+    """
+    negate = pattern.startswith("!")
+    if negate:
+        pattern = pattern[1:]
+    dir_only = pattern.endswith("/")
+    pattern = pattern.rstrip("/")
+    # 含 "/" 的模式相对同步项根目录锚定；否则匹配任意层级的文件名
+    anchored = "/" in pattern
+    pattern = pattern.lstrip("/")
+
+    out: list[str] = []
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            out.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("**", i):
+            out.append(".*")
+            i += 2
+        elif pattern[i] == "*":
+            out.append("[^/]*")
+            i += 1
+        elif pattern[i] == "?":
+            out.append("[^/]")
+            i += 1
+        elif pattern[i] == "[" and "]" in pattern[i + 2:]:
+            end = pattern.index("]", i + 2)
+            chars = pattern[i + 1:end].replace("\\", "\\\\")
+            out.append("[" + ("^" + chars[1:] if chars.startswith("!") else chars) + "]")
+            i = end + 1
+        else:
+            out.append(re.escape(pattern[i]))
+            i += 1
+
+    prefix = "" if anchored else "(?:.*/)?"
+    return prefix + "".join(out) + ("/" if dir_only else "/?"), negate
+
+
+class PatternSet:
+    """
+    一组 gitignore 风格模式，编译为单个正则。
+
+    与 .gitignore 相同，后出现的模式优先，"!" 开头的模式重新包含前面匹配到的路径。
+    """
+
+    def __init__(self, patterns: list[str]) -> None:
+        rules = [
+            _translate_pattern(p.strip())
+            for p in patterns
+            if p.strip() and not p.strip().startswith("#")
+        ]
+        # 倒序拼接：正则从左到右尝试分支，第一个完整匹配的即是列表中最后一条命中的模式
+        self._negated = {f"p{i}": negate for i, (_, negate) in enumerate(rules)}
+        alternatives = [f"(?P<p{i}>{regex})" for i, (regex, _) in reversed(list(enumerate(rules)))]
+        self._regex = re.compile("|".join(alternatives)) if alternatives else None
+
+    def __bool__(self) -> bool:
+        return self._regex is not None
+
+    def matches(self, rel_path: str, is_dir: bool = False) -> bool:
+        if self._regex is None:
+            return False
+        m = self._regex.fullmatch(rel_path + "/" if is_dir else rel_path)
+        return m is not None and not self._negated[m.lastgroup]
+
+
+def parse_size(value: Any) -> int | None:
+    """解析 "512 KiB"、"10MB"、"2G" 或整数字节数；单位均按 1024 进制。"""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    m = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([KMG]?)(?:i?B)?\s*", str(value), re.IGNORECASE)
+    if not m:
+        raise ValueError(f"Invalid size: {value!r}")
+    return int(float(m.group(1)) * 1024 ** " KMG".index(m.group(2).upper() or " "))
+
+
+class ItemFilter:
+    """
+    单个同步项的过滤规则：include / exclude 模式与单文件、整项大小上限。
+
+    配置了 include 时只保留文件本身或任一上级目录命中 include 的文件；
+    命中 exclude 的目录在遍历时整棵剪掉，不再深入。
+    """
+
+    def __init__(
+        self,
+        include: list[str] | None = None,
+        exclude: list[str] | None = None,
+        max_file_size: int | None = None,
+        max_total_size: int | None = None,
+    ) -> None:
+        self.include = PatternSet(include or [])
+        self.exclude = PatternSet(exclude or [])
+        self.max_file_size = max_file_size
+        self.max_total_size = max_total_size
+
+    def excludes(self, rel_path: str, is_dir: bool = False) -> bool:
+        """按模式判断单个路径是否被排除；不检查上级目录（遍历时已剪枝）。"""
+        if self.exclude.matches(rel_path, is_dir):
+            return True
+        if is_dir or not self.include:
+            return False
+        parts = rel_path.split("/")
+        return not any(
+            self.include.matches("/".join(parts[:n]), is_dir=n < len(parts))
+            for n in range(len(parts), 0, -1)
+        )
+
+    def allows(self, rel_path: str, is_dir: bool = False) -> bool:
+        """完整判断，含上级目录：用于 git 树条目、inotify 事件等不经过遍历的路径。"""
+        parts = rel_path.split("/")
+        if any(self.exclude.matches("/".join(parts[:n]), is_dir=True) for n in range(1, len(parts))):
+            return False
+        return not self.excludes(rel_path, is_dir)
+
+
+class Normalizer:
+    """
+    同步项的语义归一化：只用于比较，写入仓库的仍是原始内容。
+
+    依次执行：统一换行并去掉行尾空白与末尾空行（whitespace）→ YAML frontmatter 按键排序
+    （frontmatter）→ 把 mask 正则匹配到的文本替换为占位符（如 "updated: ..." 之类的易变行）。
+    源/目标归一化后相同的文件视为未变化，不触发提交与 PR。非 UTF-8 内容原样比较。
+    """
+
+    KEYS = {"whitespace", "frontmatter", "mask"}
+    MASK = "<masked>"
+
+    def __init__(self, whitespace: bool = False, frontmatter: bool = False, mask: list[str] | None = None) -> None:
+        self.whitespace = whitespace
+        self.frontmatter = frontmatter
+        self.mask = [re.compile(pattern, re.MULTILINE) for pattern in mask or []]
+        # 配置的指纹：缓存的归一化摘要只在同一套规则下复用
+        config = {"whitespace": whitespace, "frontmatter": frontmatter, "mask": mask or []}
+        self.signature = hashlib.sha1(json.dumps(config, sort_keys=True).encode()).hexdigest()[:12]
+
+    @classmethod
+    def from_config(cls, value: Any) -> Normalizer | None:
+        if not value:
+            return None
+        if not isinstance(value, dict):
+            raise ValueError(f"Invalid normalize setting (expected a mapping): {value!r}")
+        unknown = set(value) - cls.KEYS
+        if unknown:
+            raise ValueError(f"Unknown normalize keys: {', '.join(sorted(unknown))}")
+        mask = value.get("mask") or []
+        if isinstance(mask, str):
+            mask = [mask]
+        try:
+            return cls(bool(value.get("whitespace")), bool(value.get("frontmatter")), list(mask))
+        except re.error as e:
+            raise ValueError(f"Invalid normalize mask pattern: {e}") from e
+
+    def apply(self, data: bytes) -> bytes:
+        try:
+            text = data.decode("utf-8")
+        except UnicodeDecodeError:
+            return data
+        if self.whitespace:
+            lines = [line.rstrip() for line in text.replace("\r\n", "\n").replace("\r", "\n").split("\n")]
+            text = "\n".join(lines).rstrip("\n") + "\n"
+        if self.frontmatter:
+            text = self._sort_frontmatter(text)
+        for pattern in self.mask:
+            text = pattern.sub(self.MASK, text)
+        return text.encode("utf-8")
+
+    @staticmethod
+    def _sort_frontmatter(text: str) -> str:
+        """开头 "---" 与下一个 "---" 之间的 YAML 按键排序后重新输出；解析失败时原样返回。"""
+        if not text.startswith("---\n"):
+            return text
+        end = text.find("\n---", 3)
+        if end < 0:
+            return text
+        import yaml
+
+        try:
+            meta = yaml.safe_load(text[4:end])
+        except yaml.YAMLError:
+            return text
+        if not isinstance(meta, dict):
+            return text
+        dumped = yaml.safe_dump(meta, sort_keys=True, allow_unicode=True, default_flow_style=False)
+        return "---\n" + dumped + text[end + 1:]
+
+
+class SyncItem(NamedTuple):
+    """
+    sync_items 中的一项：相对 source_dir 的路径、过滤规则（无规则为 None）、原始配置
+    及语义归一化规则（未配置为 None）。
+    """
+    path: str
+    rules: ItemFilter | None
+    spec: Any
+    normalizer: Normalizer | None = None
+
+
+class SkippedPath(NamedTuple):
+    """被过滤规则跳过的文件或目录（rel 为相对同步项的路径，目录以 "/" 结尾）。"""
+    rel: str
+    reason: str
+    path: Path
+
+
+SYNC_ITEM_KEYS = {"path", "include", "exclude", "max_file_size", "max_total_size", "normalize"}
+
+
+def parse_sync_item(spec: Any) -> SyncItem:
+    """解析 sync_items 的一项：字符串路径，或含 path 及过滤规则的字典。"""
+    if isinstance(spec, str):
+        return SyncItem(spec, None, spec)
+    if not isinstance(spec, dict) or "path" not in spec:
+        raise ValueError(f"Invalid sync_items entry (expected a path or a mapping with 'path'): {spec!r}")
+    unknown = set(spec) - SYNC_ITEM_KEYS
+    if unknown:
+        raise ValueError(f"Unknown keys in sync_items entry {spec['path']!r}: {', '.join(sorted(unknown))}")
+    rules = ItemFilter(
+        include=spec.get("include"),
+        exclude=spec.get("exclude"),
+        max_file_size=parse_size(spec.get("max_file_size")),
+        max_total_size=parse_size(spec.get("max_total_size")),
+    )
+    active = rules.include or rules.exclude or rules.max_file_size is not None or rules.max_total_size is not None
+    return SyncItem(str(spec["path"]), rules if active else None, spec, Normalizer.from_config(spec.get("normalize")))
+
+
+def path_size(path: Path) -> int:
+    """文件或目录（递归）占用的字节数；只 stat 不读内容。"""
+    if not path.is_dir():
+        try:
+            return path.lstat().st_size
+        except OSError:
+            return 0
+    total = 0
+    for root, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                total += os.lstat(os.path.join(root, filename)).st_size
+            except OSError:
+                pass
+    return total
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Run Metrics
 # ─────────────────────────────────────────────────────────────────────────────
 
-def send_telegram(bot_token: str, chat_id: str, text: str) -> None:
+class RunMetrics:
     """
-    通过 Telegram Bot API 发送消息。
-    失败时只记录日志，不中断主流程。
+    单次运行的计数器与分阶段墙钟耗时（线程安全）。
+
+    多个线程/任务同时处于同一阶段时，重叠的时间只计一次。
     """
-    url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.started_at = time.time()
+            self._t0 = time.perf_counter()
+            self.counters = dict.fromkeys(METRIC_COUNTERS, 0)
+            self.phases = dict.fromkeys(METRIC_PHASES, 0.0)
+            self._active: dict[str, tuple[int, float]] = {}
+
+    def add(self, **counts: int) -> None:
+        with self._lock:
+            for name, n in counts.items():
+                self.counters[name] += n
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        with self._lock:
+            depth, since = self._active.get(name, (0, time.perf_counter()))
+            self._active[name] = (depth + 1, since)
+        try:
+            yield
+        finally:
+            with self._lock:
+                depth, since = self._active.pop(name)
+                if depth > 1:
+                    self._active[name] = (depth - 1, since)
+                else:
+                    self.phases[name] += time.perf_counter() - since
+
+    def record(self, status: str) -> dict[str, Any]:
+        """返回写入历史文件的一行记录。"""
+        return {
+            "ts": round(self.started_at, 3),
+            "status": status,
+            "duration_s": round(time.perf_counter() - self._t0, 3),
+            **self.counters,
+            "phases": {name: round(seconds, 3) for name, seconds in self.phases.items()},
+        }
+
+
+METRICS = RunMetrics()
+
+
+def timed_phase(name: str) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """装饰器：函数执行期间计入 METRICS 的 name 阶段。"""
+    def decorator(func: Callable[..., Any]) -> Callable[..., Any]:
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with METRICS.phase(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def get_history_file(config: dict[str, Any]) -> Path:
+    return get_log_dir(config) / HISTORY_FILE
+
+
+def format_prom_metrics(record: dict[str, Any]) -> str:
+    """把一次运行记录渲染为 Prometheus 文本格式。"""
+    lines: list[str] = []
+
+    def gauge(name: str, help_text: str, samples: list[tuple[str, float]]) -> None:
+        lines.append(f"# HELP openclaw_sync_{name} {help_text}")
+        lines.append(f"# TYPE openclaw_sync_{name} gauge")
+        lines.extend(f"openclaw_sync_{name}{labels} {value}" for labels, value in samples)
+
+    gauge("last_run_timestamp_seconds", "Start time of the last sync run.", [("", record["ts"])])
+    gauge("last_run_success", "1 if the last sync run exited successfully.",
+          [("", int(record["status"] != "error"))])
+    gauge("last_run_duration_seconds", "Wall time of the last sync run.", [("", record["duration_s"])])
+    for name in METRIC_COUNTERS:
+        gauge(f"last_run_{name}", f"{name.replace('_', ' ').capitalize()} in the last sync run.",
+              [("", record[name])])
+    gauge("last_run_phase_seconds", "Wall time per phase of the last sync run.",
+          [(f'{{phase="{phase}"}}', seconds) for phase, seconds in record["phases"].items()])
+    return "\n".join(lines) + "\n"
+
+
+def write_run_metrics(config: dict[str, Any], record: dict[str, Any]) -> None:
+    """追加运行历史并原子地重写 Prometheus textfile；失败只记录日志。"""
+    metrics_cfg = config.get("metrics", {})
+    if not metrics_cfg.get("enabled", True):
+        return
+    history = get_history_file(config)
+    prom = Path(metrics_cfg.get("prometheus_textfile") or get_log_dir(config) / PROM_FILE)
+    try:
+        history.parent.mkdir(parents=True, exist_ok=True)
+        with open(history, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, separators=(",", ":")) + "\n")
+        # node_exporter 可能随时读取：先写临时文件再 rename
+        prom.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = prom.with_name(f".{prom.name}.tmp")
+        tmp_path.write_text(format_prom_metrics(record), encoding="utf-8")
+        os.replace(tmp_path, prom)
+    except OSError as e:
+        logger.warning(f"Failed to write run metrics (non-fatal): {e}")
+
+
+def log_run_metrics(record: dict[str, Any]) -> None:
+    phases = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in record["phases"].items() if seconds)
+    logger.info(
+        f"Run metrics: {record['files_stated']} stat'ed, {record['files_hashed']} hashed, "
+        f"{format_bytes(record['bytes_read'])} read, {format_bytes(record['bytes_copied'])} copied, "
+        f"{record['duration_s']:.2f}s total" + (f" ({phases})" if phases else "")
+    )
+
+
+def percentile(values: list[float], pct: float) -> float:
+    """最近秩法百分位数；values 为空时返回 0。"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(1, math.ceil(pct / 100 * len(ordered))) - 1]
+
+
+def print_stats(config: dict[str, Any], weeks: int = 8) -> int:
+    """读取运行历史，打印总体 p50/p95 与最近 weeks 周的趋势。"""
+    history = get_history_file(config)
+    records: list[dict[str, Any]] = []
     try:
-        resp = requests.post(
-            url,
-            json={"chat_id": chat_id, "text": text, "parse_mode": "HTML"},
-            timeout=10,
+        with open(history, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue  # 写入中断留下的半行
+    except FileNotFoundError:
+        pass
+    if not records:
+        print(f"No run history yet: {history}")
+        return 0
+
+    first = datetime.fromtimestamp(records[0]["ts"])
+    last = datetime.fromtimestamp(records[-1]["ts"])
+    statuses: dict[str, int] = {}
+    for r in records:
+        statuses[r["status"]] = statuses.get(r["status"], 0) + 1
+    print(f"Run history: {history}")
+    print(f"  {len(records)} run(s), {first:%Y-%m-%d %H:%M} → {last:%Y-%m-%d %H:%M}")
+    print("  " + ", ".join(f"{status} {n}" for status, n in sorted(statuses.items())))
+
+    def column(key: str, rows: list[dict[str, Any]]) -> list[float]:
+        return [r.get(key, 0) for r in rows]
+
+    print(f"\n  {'':<18}{'p50':>12}{'p95':>12}")
+    rows: list[tuple[str, list[float], Callable[[float], str]]] = [
+        ("run time", column("duration_s", records), lambda v: f"{v:.2f} s"),
+        ("files stat'ed", column("files_stated", records), lambda v: f"{v:.0f}"),
+        ("files hashed", column("files_hashed", records), lambda v: f"{v:.0f}"),
+        ("bytes read", column("bytes_read", records), lambda v: format_bytes(int(v))),
+        ("bytes copied", column("bytes_copied", records), lambda v: format_bytes(int(v))),
+    ]
+    for phase in METRIC_PHASES:
+        rows.append((f"{phase} phase", [r["phases"].get(phase, 0.0) for r in records], lambda v: f"{v:.2f} s"))
+    for label, values, fmt in rows:
+        print(f"  {label:<18}{fmt(percentile(values, 50)):>12}{fmt(percentile(values, 95)):>12}")
+
+    # 按 ISO 周分组，观察 memory/ 增长带来的耗时与读取量变化
+    by_week: dict[str, list[dict[str, Any]]] = {}
+    for r in records:
+        year, week, _ = datetime.fromtimestamp(r["ts"]).isocalendar()
+        by_week.setdefault(f"{year}-W{week:02d}", []).append(r)
+    print(f"\n  {'week':<10}{'runs':>6}{'p50 time':>11}{'p95 time':>11}{'p50 stat':>10}{'p95 read':>12}")
+    for week in sorted(by_week)[-weeks:]:
+        rs = by_week[week]
+        times = column("duration_s", rs)
+        print(
+            f"  {week:<10}{len(rs):>6}{percentile(times, 50):>9.2f} s{percentile(times, 95):>9.2f} s"
+            f"{percentile(column('files_stated', rs), 50):>10.0f}"
+            f"{format_bytes(int(percentile(column('bytes_read', rs), 95))):>12}"
         )
-        resp.raise_for_status()
-        logger.info("Telegram notification sent.")
-    except Exception as e:
-        logger.warning(f"Telegram notification failed (non-fatal): {e}")
+    return 0
 
 
-def notify_telegram(config: dict[str, Any], text: str) -> None:
-    """根据配置决定是否发送 Telegram 通知。"""
+# ─────────────────────────────────────────────────────────────────────────────
+# Telegram Notification
+# ─────────────────────────────────────────────────────────────────────────────
+
+class TelegramNotifier:
+    """
+    Telegram 通知器。
+
+    事件先写入磁盘 outbox，flush 时由后台线程合并为一条消息发送（超过长度上限时分条）；
+    复用同一个 requests.Session，失败按指数退避重试。仍未送达的消息留在 outbox，
+    下次运行时与新事件一起补发，同步主流程从不等待 Telegram。
+    """
+
+    def __init__(self, config: dict[str, Any]) -> None:
+        tg = config.get("telegram", {})
+        self.bot_token = str(tg.get("bot_token", "")).strip()
+        self.chat_id = str(tg.get("chat_id", "")).strip()
+        self.api_base = str(tg.get("api_base") or TELEGRAM_API_BASE).rstrip("/")
+        self.timeout = float(tg.get("timeout_seconds", 10))
+        self.max_retries = max(1, int(tg.get("max_retries", 3)))
+        self.retry_backoff = float(tg.get("retry_backoff_seconds", 2))
+        self.outbox_path = get_log_dir(config) / TELEGRAM_OUTBOX_FILE
+        self._lock = threading.Lock()
+        self._pending = self._load_outbox()
+        self._thread: threading.Thread | None = None
+        self._session: Any = None
+
+    def _load_outbox(self) -> list[str]:
+        try:
+            with open(self.outbox_path, "r", encoding="utf-8") as f:
+                return [str(text) for text in json.load(f)]
+        except FileNotFoundError:
+            return []
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable Telegram outbox {self.outbox_path}: {e}")
+            return []
+
+    def _save_outbox(self) -> None:
+        """把未发送的消息写回 outbox（调用方持有 _lock）。"""
+        try:
+            if not self._pending:
+                self.outbox_path.unlink(missing_ok=True)
+                return
+            self.outbox_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.outbox_path.with_name(f".{self.outbox_path.name}.tmp")
+            tmp_path.write_text(json.dumps(self._pending, ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp_path, self.outbox_path)
+        except OSError as e:
+            logger.warning(f"Failed to write Telegram outbox (non-fatal): {e}")
+
+    def notify(self, text: str) -> None:
+        """记录一条通知；立即落盘，等到 flush 时与其他通知合并发送。"""
+        with self._lock:
+            self._pending.append(text)
+            self._save_outbox()
+
+    def flush(self) -> None:
+        """在后台线程发送所有待发消息，立即返回。"""
+        with self._lock:
+            if not self._pending or self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._drain, name="telegram", daemon=True)
+            self._thread.start()
+
+    def close(self, timeout: float = TELEGRAM_EXIT_WAIT_SECONDS) -> None:
+        """进程退出前最多等待 timeout 秒；未送达的消息保留在 outbox。"""
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        with self._lock:
+            if self._pending:
+                logger.warning(f"{len(self._pending)} Telegram message(s) kept in outbox for the next run.")
+                # 作废 stat 预检快照，保证下一次 cron 运行走完整流程并补发
+                PRECHECK_FILE.unlink(missing_ok=True)
+
+    def _next_batch(self) -> list[str]:
+        """从队首取出合并后不超过 Telegram 单条长度上限的一批消息（调用方持有 _lock）。"""
+        batch: list[str] = []
+        length = 0
+        for text in self._pending:
+            extra = len(text) + (len(TELEGRAM_BATCH_SEPARATOR) if batch else 0)
+            if batch and length + extra > TELEGRAM_MAX_MESSAGE_LENGTH:
+                break
+            batch.append(text)
+            length += extra
+        return batch
+
+    def _drain(self) -> None:
+        while True:
+            with self._lock:
+                batch = self._next_batch()
+                if not batch:
+                    self._thread = None
+                    return
+            if not self._send(TELEGRAM_BATCH_SEPARATOR.join(batch)):
+                with self._lock:
+                    self._thread = None
+                return
+            with self._lock:
+                del self._pending[: len(batch)]
+                self._save_outbox()
+
+    def _send(self, text: str) -> bool:
+        """
+        通过 Bot API 发送一条消息，网络错误、429 与 5xx 按指数退避重试。
+        返回 True 表示消息已处理完毕（送达，或被 API 永久拒绝而丢弃）。
+        """
+        import requests
+
+        if self._session is None:
+            self._session = requests.Session()
+        url = f"{self.api_base}/bot{self.bot_token}/sendMessage"
+        payload = {"chat_id": self.chat_id, "text": text, "parse_mode": "HTML"}
+        error = ""
+        for attempt in range(self.max_retries):
+            delay = self.retry_backoff * 2 ** attempt
+            try:
+                resp = self._session.post(url, json=payload, timeout=self.timeout)
+            except requests.RequestException as e:
+                # 异常信息中的 URL 含 bot token，不能原样写进日志
+                error = str(e).replace(self.bot_token, "<token>")
+            else:
+                if resp.ok:
+                    logger.info("Telegram notification sent.")
+                    return True
+                if resp.status_code != 429 and resp.status_code < 500:
+                    logger.warning(
+                        f"Telegram rejected notification, dropping it: HTTP {resp.status_code} {resp.text[:200]}"
+                    )
+                    return True
+                error = f"HTTP {resp.status_code}"
+                try:
+                    delay = max(delay, float(resp.json()["parameters"]["retry_after"]))
+                except (ValueError, KeyError, TypeError):
+                    pass
+            if attempt + 1 < self.max_retries:
+                logger.debug(f"Telegram send attempt {attempt + 1} failed ({error}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+        logger.warning(f"Telegram notification failed after {self.max_retries} attempt(s), kept in outbox: {error}")
+        return False
+
+
+_notifier: TelegramNotifier | None = None
+
+
+def get_notifier(config: dict[str, Any]) -> TelegramNotifier | None:
+    """telegram.enabled 且 bot_token/chat_id 齐全时返回进程内共享的通知器，否则返回 None。"""
+    global _notifier
     tg = config.get("telegram", {})
     if not tg.get("enabled", False):
-        return
-    bot_token = tg.get("bot_token", "").strip()
-    chat_id = str(tg.get("chat_id", "")).strip()
-    if not bot_token or not chat_id:
+        return None
+    if not str(tg.get("bot_token", "")).strip() or not str(tg.get("chat_id", "")).strip():
         logger.warning("Telegram enabled but bot_token/chat_id not set — skipping notification.")
-        return
-    send_telegram(bot_token, chat_id, text)
+        return None
+    if _notifier is None:
+        _notifier = TelegramNotifier(config)
+    return _notifier
+
+
+@timed_phase("notify")
+def notify_telegram(config: dict[str, Any], text: str) -> None:
+    """根据配置把一条通知加入待发队列；本次运行结束时统一发送。"""
+    notifier = get_notifier(config)
+    if notifier is not None:
+        notifier.notify(text)
+
+
+def flush_notifications(config: dict[str, Any]) -> None:
+    """后台发送本次运行累积的通知（以及 outbox 中此前未送达的通知）。"""
+    notifier = get_notifier(config)
+    if notifier is not None:
+        notifier.flush()
+
+
+def close_notifications() -> None:
+    if _notifier is not None:
+        _notifier.close()
 
 
 # ─────────────────────────────────────────────────────────────────────────────
 # File Operations
 # ─────────────────────────────────────────────────────────────────────────────
 
-def calculate_file_hash(filepath: Path) -> str:
-    """计算文件的 MD5 哈希值。"""
-    hash_md5 = hashlib.md5()
+class HashManifest:
+    """
+    持久化的文件摘要缓存。
+
+    以文件路径为键，记录上次哈希时的 (size, mtime_ns, inode) 及摘要；
+    stat 签名未变的文件直接复用摘要，不再读取内容。
+    另以 "<归一化规则指纹>:<原始摘要>" 为键缓存归一化后的摘要（按内容寻址，与路径无关），
+    以目录路径为键缓存 (直接子项 stat 指纹, 树摘要)。
+    """
+
+    def __init__(self, path: Path | None = None) -> None:
+        self.path = path
+        self.entries: dict[str, list] = {}
+        self.seen: set[str] = set()
+        self.normalized: dict[str, str] = {}
+        self.normalized_seen: set[str] = set()
+        self.dirs: dict[str, list] = {}
+        self.dirs_seen: set[str] = set()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: Path) -> "HashManifest":
+        """从磁盘加载清单；文件缺失、损坏或版本不符时返回空清单。"""
+        manifest = cls(path)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == MANIFEST_VERSION:
+                manifest.entries = data.get("entries", {})
+                manifest.normalized = data.get("normalized", {})
+                manifest.dirs = data.get("dirs", {})
+        except (OSError, ValueError):
+            pass
+        return manifest
+
+    def lookup(self, key: str, st: os.stat_result) -> str | None:
+        """stat 签名与缓存一致时返回缓存的摘要，否则返回 None。"""
+        with self._lock:
+            self.seen.add(key)
+            entry = self.entries.get(key)
+            if entry and entry[:3] == [st.st_size, st.st_mtime_ns, st.st_ino]:
+                self.hits += 1
+                return entry[3]
+            self.misses += 1
+            return None
+
+    def peek(self, key: str, st: os.stat_result) -> str | None:
+        """与 lookup 相同，但不计入命中统计。"""
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry and entry[:3] == [st.st_size, st.st_mtime_ns, st.st_ino]:
+                return entry[3]
+            return None
+
+    def store(self, key: str, st: os.stat_result, digest: str) -> None:
+        """记录文件摘要。mtime 过新（可能仍在写入）的文件不缓存。"""
+        with self._lock:
+            self.seen.add(key)
+            if time.time_ns() - st.st_mtime_ns < RACY_WINDOW_NS:
+                self.entries.pop(key, None)
+                return
+            self.entries[key] = [st.st_size, st.st_mtime_ns, st.st_ino, digest]
+
+    def lookup_normalized(self, key: str) -> str | None:
+        with self._lock:
+            self.normalized_seen.add(key)
+            return self.normalized.get(key)
+
+    def store_normalized(self, key: str, digest: str) -> None:
+        with self._lock:
+            self.normalized_seen.add(key)
+            self.normalized[key] = digest
+
+    def touch(self, keys: Iterable[str]) -> None:
+        """标记这些路径本次仍存在（save 时保留其条目），不做 stat 比较。"""
+        with self._lock:
+            self.seen.update(keys)
+
+    def lookup_dir(self, key: str, fingerprint: str) -> str | None:
+        """目录的直接子项指纹与缓存一致时返回缓存的树摘要。"""
+        with self._lock:
+            self.dirs_seen.add(key)
+            entry = self.dirs.get(key)
+            return entry[1] if entry and entry[0] == fingerprint else None
+
+    def store_dir(self, key: str, fingerprint: str, digest: str) -> None:
+        with self._lock:
+            self.dirs_seen.add(key)
+            self.dirs[key] = [fingerprint, digest]
+
+    def save(self) -> None:
+        """原子写回清单，只保留本次运行中出现过的路径、目录与归一化摘要。"""
+        if self.path is None:
+            return
+        entries = {k: v for k, v in self.entries.items() if k in self.seen}
+        data: dict[str, Any] = {"version": MANIFEST_VERSION, "entries": entries}
+        normalized = {k: v for k, v in self.normalized.items() if k in self.normalized_seen}
+        if normalized:
+            data["normalized"] = normalized
+        dirs = {k: v for k, v in self.dirs.items() if k in self.dirs_seen}
+        if dirs:
+            data["dirs"] = dirs
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(tmp_path, self.path)
+
+
+def git_blob_hash(filepath: Path | str) -> str:
+    """按 git blob 格式计算 SHA-1：sha1(b"blob <size>\\0" + content)。"""
     with open(filepath, "rb") as f:
-        for chunk in iter(lambda: f.read(4096), b""):
-            hash_md5.update(chunk)
-    return hash_md5.hexdigest()
+        size = os.fstat(f.fileno()).st_size
+        h = hashlib.sha1(b"blob %d\0" % size)
+        n_read = 0
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            h.update(chunk)
+            n_read += len(chunk)
+    METRICS.add(files_hashed=1, bytes_read=n_read)
+    if n_read != size:
+        # 读取期间文件长度发生变化：按实际读到的内容重新计算
+        with open(filepath, "rb") as f:
+            data = f.read()
+        METRICS.add(bytes_read=len(data))
+        return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+    return h.hexdigest()
+
+
+def calculate_file_hash(
+    filepath: Path | str,
+    manifest: HashManifest | None = None,
+    st: os.stat_result | None = None,
+) -> str:
+    """
+    计算文件的 git blob 摘要（与 git hash-object 相同），可直接与索引中的 blob ID 比较。
+    提供 manifest 时 stat 未变的文件直接复用缓存。
+    """
+    if manifest is not None:
+        # 先 stat 再读：读取期间若文件被修改，下次运行的 stat 签名必然不同
+        st = st or os.stat(filepath)
+        key = str(filepath)
+        cached = manifest.lookup(key, st)
+        if cached is not None:
+            return cached
+
+    digest = git_blob_hash(filepath)
+
+    if manifest is not None:
+        manifest.store(key, st, digest)
+    return digest
+
 
+def blob_digest(data: bytes) -> str:
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
 
-def calculate_dir_hash(dirpath: Path) -> str:
-    """计算目录下所有文件的组合哈希值。"""
-    hashes: list[tuple[str, str]] = []
 
-    for root, _, files in os.walk(dirpath):
-        for filename in sorted(files):
-            filepath = Path(root) / filename
+def normalized_digest(
+    normalizer: Normalizer,
+    raw_digest: str,
+    read: Callable[[], bytes],
+    manifest: HashManifest | None = None,
+) -> str:
+    """
+    返回内容经 normalizer 归一化后的 blob 摘要。按原始摘要缓存在 manifest 中，
+    命中时不读取内容；未命中才调用 read 读取，并以实际读到内容的摘要为键记录。
+    """
+    key = f"{normalizer.signature}:{raw_digest}"
+    if manifest is not None:
+        cached = manifest.lookup_normalized(key)
+        if cached is not None:
+            return cached
+    data = read()
+    METRICS.add(bytes_read=len(data))
+    digest = blob_digest(normalizer.apply(data))
+    if manifest is not None:
+        manifest.store_normalized(f"{normalizer.signature}:{blob_digest(data)}", digest)
+    return digest
+
+
+class FileInfo(NamedTuple):
+    """文件大小与 git blob 摘要；大小已足以判定变更时 digest 为 None（未读取内容）。"""
+    size: int
+    digest: str | None
+
+
+class DirChanges(NamedTuple):
+    """目录级对比结果：相对路径列表，以及需写入/可跳过的字节数。"""
+    added: list[str]
+    modified: list[str]
+    deleted: list[str]
+    bytes_to_write: int
+    bytes_skipped: int
+
+
+class StagedChange(NamedTuple):
+    """private_index 模式下待写入提交的单个文件变更；src 为 None 表示删除。"""
+    path: str
+    src: Path | None
+
+
+def list_dir_files(
+    dirpath: Path,
+    rules: ItemFilter | None = None,
+    skipped: list[SkippedPath] | None = None,
+    digests: dict[str, str] | None = None,
+    manifest: HashManifest | None = None,
+    blobs: dict[str, str] | None = None,
+    only: Container[str] | None = None,
+) -> list[tuple[str, str, os.stat_result | None]]:
+    """
+    按确定顺序列出目录下所有文件的 (相对路径, 绝对路径, stat)，只做目录遍历不读内容。
+
+    每层一次 os.scandir：相对路径前缀每层拼接一次，文件 stat 在遍历时取得并交给后续
+    哈希步骤复用，不为每个文件构造 Path。stat 失败的文件记为 None，由调用方重新 stat。
+    与 os.walk 默认行为相同，不进入指向目录的符号链接，读取失败的目录静默跳过。
+    给定 rules 时被排除的目录在遍历中直接剪枝，被跳过的路径追加到 skipped。
+
+    给定 digests 时（不带 rules）顺带用已知摘要计算各目录的树 ID（combine_tree 的 cached_only），
+    以相对路径为键记入 digests（根目录为 ""），不读取文件内容；摘要未知的目录及其上级不记录。
+给定 only 时只计算其中列出的目录：另一端已确定有变化的目录不必再组合树 ID。
+    """
+    listing: list[tuple[str, str, os.stat_result | None]] = []
+
+    def walk(path: str, prefix: str) -> str | None:
+        files: list[os.DirEntry] = []
+        subdirs: list[os.DirEntry] = []
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    try:
+                        is_dir = entry.is_dir()
+                    except OSError:
+                        is_dir = False
+                    if not is_dir:
+                        files.append(entry)
+                    elif not entry.is_symlink():
+                        subdirs.append(entry)
+        except OSError:
+            return ""
+
+        n_stated = 0
+        unknown = False
+        tree_files: list[tuple[str, os.stat_result]] = []
+        for entry in sorted(files, key=lambda e: e.name):
+            rel = prefix + entry.name
+            if rules is not None and rules.excludes(rel):
+                if skipped is not None:
+                    skipped.append(SkippedPath(rel, "excluded", Path(entry.path)))
+                continue
             try:
-                file_hash = calculate_file_hash(filepath)
-                rel_path = filepath.relative_to(dirpath)
-                hashes.append((str(rel_path), file_hash))
-            except (OSError, IOError):
+                st: os.stat_result | None = entry.stat()
+                n_stated += 1
+            except OSError:
+                st = None
+            listing.append((rel, entry.path, st))
+            if digests is not None:
+                if st is None or not S_ISREG(st.st_mode):
+                    unknown = True
+                else:
+                    tree_files.append((entry.name, st))
+        METRICS.add(files_stated=n_stated)
+
+        subtrees: list[tuple[str, str]] = []
+        for entry in sorted(subdirs, key=lambda e: e.name):
+            rel = prefix + entry.name
+            if rules is not None and rules.excludes(rel, is_dir=True):
+                if skipped is not None:
+                    skipped.append(SkippedPath(rel + "/", "excluded", Path(entry.path)))
                 continue
+            digest = walk(entry.path, rel + "/")
+            if digest == "":
+                unknown = True
+            elif digest is not None:
+                subtrees.append((entry.name, digest))
+
+        if digests is None or unknown or (only is not None and prefix[:-1] not in only):
+            return ""
+        tree = combine_tree(path, tree_files, subtrees, manifest, blobs=blobs, cached_only=True)
+        if tree:
+            digests[prefix[:-1]] = tree
+        return tree
+
+    walk(str(dirpath), "")
+    return listing
+
+
+def get_file_info(
+    filepath: Path | str,
+    manifest: HashManifest | None = None,
+    st: os.stat_result | None = None,
+) -> FileInfo | None:
+    """返回文件的 (size, digest)；给定 st 时不再重新 stat。文件不可读时返回 None。"""
+    try:
+        if st is None:
+            st = os.stat(filepath)
+            METRICS.add(files_stated=1)
+        return FileInfo(st.st_size, calculate_file_hash(filepath, manifest, st))
+    except (OSError, IOError):
+        return None
+
+
+@contextmanager
+def shared_or_new_pool(executor: Executor | None, workers: int) -> Iterator[Executor]:
+    """复用调用方提供的线程池；未提供时临时创建一个。"""
+    if executor is not None:
+        yield executor
+        return
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        yield pool
 
-    combined = "".join(f"{path}:{hash_val}" for path, hash_val in sorted(hashes))
-    return hashlib.md5(combined.encode()).hexdigest()
 
+def hash_tree(
+    dirpath: str,
+    manifest: HashManifest | None = None,
+    executor: Executor | None = None,
+) -> str | None:
+    """
+    流式计算目录的 Merkle 摘要，格式与 git 树对象相同（结果即 git write-tree 得到的树 ID）。
 
-def get_item_hash(item_path: Path) -> str:
-    """获取文件或目录的哈希值。"""
-    if item_path.is_file():
-        return calculate_file_hash(item_path)
-    elif item_path.is_dir():
-        return calculate_dir_hash(item_path)
-    return ""
+    每层用 os.scandir 取目录项（文件 stat 由 DirEntry 提供），按 git 规则排序后直接哈希，
+    内存只与单层目录项数相关，不构造 Path、不拼接整棵树的路径。不进入符号链接目录；
+    空目录返回 None（git 不记录空目录）。
 
+    给定 manifest 时文件摘要走清单缓存；某一层的直接子项（文件 stat 签名、子目录摘要）
+    与上次完全一致时直接复用缓存的树摘要，只有变化所在的子目录及其上级需要重新组合。
+    """
+    files: list[tuple[str, os.stat_result]] = []
+    subdirs: list[str] = []
+    with os.scandir(dirpath) as it:
+        for entry in it:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.name)
+                elif entry.is_file():
+                    files.append((entry.name, entry.stat()))
+            except OSError:
+                continue
+    METRICS.add(files_stated=len(files))
+
+    subtrees: list[tuple[str, str]] = []
+    for name in subdirs:
+        digest = hash_tree(os.path.join(dirpath, name), manifest, executor)
+        if digest is not None:
+            subtrees.append((name, digest))
+    return combine_tree(dirpath, files, subtrees, manifest, executor)
+
+
+def combine_tree(
+    dirpath: str,
+    files: list[tuple[str, os.stat_result]],
+    subtrees: list[tuple[str, str]],
+    manifest: HashManifest | None = None,
+    executor: Executor | None = None,
+    blobs: dict[str, str] | None = None,
+    cached_only: bool = False,
+) -> str | None:
+    """
+    由一层目录的文件 (名称, stat) 与子目录 (名称, 树 ID) 组合出该目录的树 ID，
+    供 hash_tree 与 list_dir_files 共用；目录为空时返回 None。
+
+    cached_only 时不读取文件内容，只用 blobs（以路径为键的已知 blob ID）与清单中的摘要，
+    有文件摘要未知时返回 ""。
+    """
+    entries: list[tuple[bytes, bytes, str]] = [  # (排序键, 模式, 摘要)
+        (name.encode() + b"/", b"40000 " + name.encode(), digest) for name, digest in subtrees
+    ]
+    if not files and not entries:
+        return None
+    if cached_only and manifest is not None:
+        # 目录未变时这些文件随目录整体跳过、不再查询清单：标记仍存在，保留其条目
+        manifest.touch(os.path.join(dirpath, name) for name, _ in files)
+
+    fingerprint = ""
+    if manifest is not None:
+        h = hashlib.sha1()
+        for name, st in sorted(files):
+            h.update(f"{name}\0{st.st_size}:{st.st_mtime_ns}:{st.st_ino}:{st.st_mode}\n".encode())
+        for key, _, digest in sorted(entries):
+            h.update(key + digest.encode() + b"\n")
+        fingerprint = h.hexdigest()
+        cached = manifest.lookup_dir(dirpath, fingerprint)
+        if cached is not None:
+            # 文件条目同样保留在清单中，该目录之后变化时其余文件仍可复用摘要
+            if not cached_only:
+                manifest.touch(os.path.join(dirpath, name) for name, _ in files)
+            return cached
+
+    def file_digest(item: tuple[str, os.stat_result]) -> str | None:
+        name, st = item
+        path = os.path.join(dirpath, name)
+        if blobs is not None and path in blobs:
+            return blobs[path]
+        if manifest is not None:
+            cached = manifest.peek(path, st) if cached_only else manifest.lookup(path, st)
+            if cached is not None:
+                return cached
+        if cached_only:
+            return ""
+        try:
+            digest = git_blob_hash(path)
+        except OSError:
+            return None
+        if manifest is not None:
+            manifest.store(path, st, digest)
+        return digest
+
+    digests = executor.map(file_digest, files) if executor is not None else map(file_digest, files)
+    for (name, st), digest in zip(files, digests):
+        if digest == "":
+            return ""
+        if digest is not None:
+            mode = b"100755 " if st.st_mode & S_IXUSR else b"100644 "
+            entries.append((name.encode(), mode + name.encode(), digest))
+
+    body = b"".join(mode_name + b"\0" + bytes.fromhex(digest) for _, mode_name, digest in sorted(entries))
+    tree = hashlib.sha1(b"tree %d\0" % len(body) + body).hexdigest()
+
+    # 子项 mtime 仍在 racy 窗口内时不缓存：同一时间戳内的后续写入无法从 stat 上察觉
+    if manifest is not None and all(time.time_ns() - st.st_mtime_ns >= RACY_WINDOW_NS for _, st in files):
+        manifest.store_dir(dirpath, fingerprint, tree)
+    return tree
+
+
+def calculate_dir_hash(
+    dirpath: Path,
+    manifest: HashManifest | None = None,
+    executor: Executor | None = None,
+) -> str:
+    """计算目录的 Merkle 摘要（git 树 ID，见 hash_tree）；给定线程池时每层的文件并行哈希。"""
+    return hash_tree(str(dirpath), manifest, executor) or EMPTY_TREE_DIGEST
+
+
+def unchanged_subtrees(src_digests: dict[str, str], dst_digests: dict[str, str]) -> set[str]:
+    """两端树 ID 相同的目录（相对路径）：内容完全一致，同步时可整棵跳过。"""
+    return {rel for rel, tree in src_digests.items() if dst_digests.get(rel) == tree}
+
+
+def in_subtrees(rel_path: str, subtrees: set[str] | frozenset[str]) -> bool:
+    """rel_path 是否位于 subtrees 中任一目录之下。"""
+    if not subtrees:
+        return False
+    parts = rel_path.split("/")
+    return any("/".join(parts[:n]) in subtrees for n in range(1, len(parts)))
+
+
+def drop_subtrees(
+    listing: list[tuple[str, str, os.stat_result | None]], subtrees: set[str]
+) -> list[tuple[str, str, os.stat_result | None]]:
+    """从 list_dir_files 的结果中去掉 subtrees 中目录下的文件，每个目录只判断一次。"""
+    dropped: dict[str, bool] = {}
+    kept = []
+    for entry in listing:
+        parent = entry[0].rpartition("/")[0]
+        if parent not in dropped:
+            dropped[parent] = in_subtrees(entry[0], subtrees)
+        if not dropped[parent]:
+            kept.append(entry)
+    return kept
+
+
+def diff_dir_files(src_files: dict[str, FileInfo], dst_files: dict[str, FileInfo]) -> DirChanges:
+    """按文件摘要对比源/目标目录，得出新增、修改、删除的文件。"""
+    added: list[str] = []
+    modified: list[str] = []
+    bytes_to_write = bytes_skipped = 0
+
+    for rel_path in sorted(src_files):
+        info = src_files[rel_path]
+        dst_info = dst_files.get(rel_path)
+        if dst_info is None:
+            added.append(rel_path)
+        elif dst_info.size != info.size or dst_info.digest != info.digest:
+            modified.append(rel_path)
+        else:
+            bytes_skipped += info.size
+            continue
+        bytes_to_write += info.size
+
+    deleted = sorted(set(dst_files) - set(src_files))
+    return DirChanges(added, modified, deleted, bytes_to_write, bytes_skipped)
+
+
+def format_bytes(n: int) -> str:
+    for unit in ("B", "KiB", "MiB"):
+        if n < 1024:
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
+    return f"{n:.1f} GiB"
+
+
+def _reflink(fsrc: int, fdst: int, size: int) -> int:
+    import fcntl
+
+    fcntl.ioctl(fdst, FICLONE, fsrc)
+    return size
+
+
+def _copy_file_range(fsrc: int, fdst: int, size: int) -> int:
+    copied = 0
+    while copied < size:
+        n = os.copy_file_range(fsrc, fdst, size - copied)
+        if n == 0:
+            break
+        copied += n
+    return copied
 
-def copy_item(src: Path, dst: Path, dry_run: bool = False) -> bool:
+
+def _sendfile(fsrc: int, fdst: int, size: int) -> int:
+    copied = 0
+    while copied < size:
+        n = os.sendfile(fdst, fsrc, copied, size - copied)
+        if n == 0:
+            break
+        copied += n
+    return copied
+
+
+ZERO_COPY_METHODS: list[tuple[str, Callable[[int, int, int], int]]] = [("reflink", _reflink)]
+if hasattr(os, "copy_file_range"):
+    ZERO_COPY_METHODS.append(("copy_file_range", _copy_file_range))
+if hasattr(os, "sendfile"):
+    ZERO_COPY_METHODS.append(("sendfile", _sendfile))
+
+# 这些 errno 表示该复制方式在当前文件系统组合上不可用，而不是复制本身出错
+_COPY_UNSUPPORTED_ERRNOS = {
+    errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTTY, errno.EBADF, errno.EPERM,
+}
+# 已确认不可用的 (复制方式, 源设备, 目标设备)，后续文件不再重复尝试
+_unsupported_copy: set[tuple[str, int, int]] = set()
+
+
+def copy_file_data(fsrc: int, fdst: int, size: int, devices: tuple[int, int]) -> tuple[str, int]:
+    """
+    依次尝试 reflink → copy_file_range → sendfile，数据不经过用户态。
+    返回 (复制方式, 字节数)；全部不可用时返回 ("", 0)，文件偏移已复位，可改用缓冲复制。
+
+    某方式对非空文件一个字节也没复制（部分内核与文件系统上 copy_file_range 直接返回 0，
+    如 procfs/sysfs 或跨文件系统的旧内核）同样视为不可用，改试下一种方式。
+    """
+    for name, copy in ZERO_COPY_METHODS:
+        if (name, *devices) in _unsupported_copy:
+            continue
+        try:
+            n_copied = copy(fsrc, fdst, size)
+            if n_copied or not size:
+                return name, n_copied
+            reason: Any = "copied 0 bytes"
+        except OSError as e:
+            if e.errno not in _COPY_UNSUPPORTED_ERRNOS:
+                raise
+            reason = e
+        _unsupported_copy.add((name, *devices))
+        logger.debug(f"{name} unavailable between devices {devices}: {reason}")
+        os.ftruncate(fdst, 0)
+        os.lseek(fdst, 0, os.SEEK_SET)
+        os.lseek(fsrc, 0, os.SEEK_SET)
+    return "", 0
+
+
+def atomic_copy_file(src: Path, dst: Path, manifest: HashManifest | None = None) -> None:
+    """
+    先复制到同目录临时文件再 rename，目标文件要么是旧内容要么是完整的新内容，元数据同 copy2。
+
+    变更检测时已算出摘要（记在 manifest 中）的文件交给内核复制（copy_file_data），
+    结果按大小校验，不重新读取。摘要未知的文件（按大小判定为已修改、未经哈希）改走
+    缓冲复制，边复制边计算摘要记入 manifest：下次运行直接命中缓存，哈希开销只与
+    变化的文件相关，不会在下次运行时再把整个文件读一遍。
+
+    注意：memory/ 下只追加写入的日志多属摘要未知的情况，因此实际工作负载中内核复制
+    主要用于摘要已知的文件。
+    """
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = dst.with_name(f".{dst.name}.sync-tmp")
+    digest: str | None = None
+    try:
+        with open(src, "rb") as fsrc, open(tmp_path, "wb") as fdst:
+            st = os.fstat(fsrc.fileno())
+            known = manifest.peek(str(src), st) if manifest is not None else None
+            method, n_copied = "", 0
+            if known is not None:
+                devices = (st.st_dev, os.fstat(fdst.fileno()).st_dev)
+                method, n_copied = copy_file_data(fsrc.fileno(), fdst.fileno(), st.st_size, devices)
+                if method and n_copied != st.st_size:
+                    raise OSError(f"short copy via {method}: {n_copied} of {st.st_size} bytes")
+            if not method:
+                method = "buffered"
+                h = hashlib.sha1(b"blob %d\0" % st.st_size)
+                for chunk in iter(lambda: fsrc.read(HASH_CHUNK_SIZE), b""):
+                    h.update(chunk)
+                    fdst.write(chunk)
+                    n_copied += len(chunk)
+                if n_copied == st.st_size:
+                    digest = h.hexdigest()
+        shutil.copystat(src, tmp_path)
+        METRICS.add(bytes_copied=n_copied)
+        os.replace(tmp_path, dst)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    logger.debug(f"Copied {src} -> {dst} ({method}, {format_bytes(n_copied)})")
+    if manifest is not None and digest is not None:
+        manifest.store(str(src), st, digest)
+
+
+@timed_phase("copy")
+def sync_dir_incremental(
+    src: Path,
+    dst: Path,
+    changes: DirChanges,
+    dry_run: bool = False,
+    executor: Executor | None = None,
+    manifest: HashManifest | None = None,
+) -> bool:
     """
-    复制文件或目录到目标位置。
+    按文件粒度把 src 目录同步到 dst：只写入新增/修改的文件，删除放在最后。
+    给定线程池时并行复制。返回是否有文件发生变化（dry-run 时返回是否会变化）。
+    """
+    n_changed = len(changes.added) + len(changes.modified) + len(changes.deleted)
+    summary = (
+        f"{len(changes.added)} added, {len(changes.modified)} modified, "
+        f"{len(changes.deleted)} deleted — {format_bytes(changes.bytes_to_write)} written, "
+        f"{format_bytes(changes.bytes_skipped)} skipped"
+    )
+
+    if dry_run:
+        logger.info(f"[DRY RUN] Would sync directory {src} -> {dst}: {summary}")
+        for rel_path in changes.added:
+            logger.info(f"[DRY RUN]   + {rel_path}")
+        for rel_path in changes.modified:
+            logger.info(f"[DRY RUN]   ~ {rel_path}")
+        for rel_path in changes.deleted:
+            logger.info(f"[DRY RUN]   - {rel_path}")
+        return n_changed > 0
+
+    try:
+        to_copy = changes.added + changes.modified
+        if executor is None:
+            for rel_path in to_copy:
+                atomic_copy_file(src / rel_path, dst / rel_path, manifest)
+        else:
+            # list() 消费迭代器，任一复制失败都会在此重新抛出
+            list(executor.map(lambda rel: atomic_copy_file(src / rel, dst / rel, manifest), to_copy))
+
+        for rel_path in changes.deleted:
+            (dst / rel_path).unlink(missing_ok=True)
+        # 删除后清理变空的子目录（自底向上）
+        for rel_path in sorted({str(Path(p).parent) for p in changes.deleted}, reverse=True):
+            parent = dst / rel_path
+            while parent != dst and parent.is_dir() and not any(parent.iterdir()):
+                parent.rmdir()
+                parent = parent.parent
+    except Exception as e:
+        logger.error(f"Failed to sync directory {src} to {dst}: {e}")
+        return False
+
+    logger.debug(f"Synced directory: {src} -> {dst}: {summary}")
+    return n_changed > 0
+
+
+@timed_phase("copy")
+def copy_item(
+    src: Path, dst: Path, dry_run: bool = False, manifest: HashManifest | None = None
+) -> bool:
+    """
+    复制单个文件到目标位置（目录由 sync_dir_incremental 按文件同步）。
     返回是否发生了实际复制操作。
     """
     if dry_run:
@@ -170,16 +1526,10 @@ def copy_item(src: Path, dst: Path, dry_run: bool = False) -> bool:
 
     try:
         if src.is_file():
-            dst.parent.mkdir(parents=True, exist_ok=True)
-            shutil.copy2(src, dst)
+            atomic_copy_file(src, dst, manifest)
             logger.debug(f"Copied file: {src} -> {dst}")
-        elif src.is_dir():
-            if dst.exists():
-                shutil.rmtree(dst)
-            shutil.copytree(src, dst)
-            logger.debug(f"Copied directory: {src} -> {dst}")
         else:
-            logger.warning(f"Source does not exist or is not a file/dir: {src}")
+            logger.warning(f"Source does not exist or is not a file: {src}")
             return False
         return True
     except Exception as e:
@@ -191,16 +1541,25 @@ def copy_item(src: Path, dst: Path, dry_run: bool = False) -> bool:
 # Git Operations
 # ─────────────────────────────────────────────────────────────────────────────
 
-def run_git(args: list[str], cwd: Path, check: bool = True) -> subprocess.CompletedProcess:
-    """运行 git 命令。"""
-    cmd = ["git"] + args
+def run_git(
+    args: list[str],
+    cwd: Path,
+    check: bool = True,
+    env: dict[str, str] | None = None,
+    input: str | None = None,
+) -> subprocess.CompletedProcess:
+    """运行 git 命令。env 中的变量叠加到当前环境上（如 GIT_INDEX_FILE）。"""
+    cmd = [GIT_BIN] + args
     logger.debug(f"Running: {' '.join(cmd)}")
-    return subprocess.run(cmd, cwd=cwd, capture_output=True, text=True, check=check)
+    full_env = {**os.environ, **env} if env else None
+    return subprocess.run(
+        cmd, cwd=cwd, capture_output=True, text=True, check=check, env=full_env, input=input
+    )
 
 
 def run_gh(args: list[str], cwd: Path, check: bool = True) -> subprocess.CompletedProcess:
     """运行 gh CLI 命令。"""
-    cmd = ["gh"] + args
+    cmd = [GH_BIN] + args
     logger.debug(f"Running: {' '.join(cmd)}")
     return subprocess.run(cmd, cwd=cwd, capture_output=True, text=True, check=check)
 
@@ -211,10 +1570,180 @@ def has_uncommitted_changes(repo_path: Path) -> bool:
     return bool(result.stdout.strip())
 
 
+def drop_ignored_paths(repo_path: Path, paths: list[str]) -> list[str]:
+    """
+    去掉命中 .gitignore 等忽略规则的路径（update-index 不看忽略规则，add -A 会跳过它们）。
+    已跟踪的文件不受忽略规则影响，check-ignore 不会报告它们，仍会被暂存。
+    """
+    if not paths:
+        return paths
+    result = run_git(
+        ["check-ignore", "--stdin", "-z"],
+        cwd=repo_path,
+        check=False,
+        input="".join(f"{path}\0" for path in paths),
+    )
+    if result.returncode not in (0, 1):
+        raise subprocess.CalledProcessError(result.returncode, result.args, result.stdout, result.stderr)
+    ignored = {path for path in result.stdout.split("\0") if path}
+    if ignored:
+        logger.info(f"Not staging {len(ignored)} path(s) matched by .gitignore")
+    return [path for path in paths if path not in ignored]
+
+
+def enable_status_acceleration(repo_path: Path) -> None:
+    """
+    为 checkout/pull/status 开启 untracked cache 及（git 内置支持时）fsmonitor 守护进程，
+    大仓库中不再每次遍历全部目录。用户已显式配置过的不覆盖。
+    """
+    result = run_git(
+        ["config", "--get-regexp", r"^core\.(untrackedcache|fsmonitor)$"], cwd=repo_path, check=False
+    )
+    configured = {line.split()[0].lower() for line in result.stdout.splitlines() if line.strip()}
+    if "core.untrackedcache" not in configured:
+        run_git(["config", "core.untrackedCache", "true"], cwd=repo_path, check=False)
+        logger.info("Enabled core.untrackedCache for faster git status")
+    if "core.fsmonitor" not in configured:
+        build = run_git(["version", "--build-options"], cwd=repo_path, check=False).stdout
+        if "fsmonitor--daemon" in build:
+            run_git(["config", "core.fsmonitor", "true"], cwd=repo_path, check=False)
+            logger.info("Enabled core.fsmonitor (built-in daemon) for faster git status")
+
+
+@timed_phase("hash")
+def load_index_blobs(repo_path: Path, pathspec: str) -> dict[str, str]:
+    """
+    一次 `git ls-files -s` 读取 pathspec 下已跟踪文件的 blob ID，返回 {绝对路径: blob}。
+    工作区相对索引有改动的文件（`git diff-files`，只比较 stat）被剔除，交由调用方重新哈希。
+    git 不可用时返回空字典。
+    """
+    try:
+        staged = run_git(["ls-files", "-s", "-z", "--", pathspec], cwd=repo_path)
+        dirty = run_git(["diff-files", "--name-only", "-z", "--", pathspec], cwd=repo_path)
+    except (OSError, subprocess.CalledProcessError) as e:
+        logger.debug(f"git index unavailable, hashing target files instead: {e}")
+        return {}
+
+    dirty_paths = set(filter(None, dirty.stdout.split("\0")))
+    blobs: dict[str, str] = {}
+    for record in filter(None, staged.stdout.split("\0")):
+        # "<mode> <blob> <stage>\t<path>"
+        meta, path = record.split("\t", 1)
+        mode, blob, _ = meta.split(" ")
+        if mode in ("100644", "100755") and path not in dirty_paths:
+            blobs[str(repo_path / path)] = blob
+    return blobs
+
+
+@timed_phase("hash")
+def load_tree_files(repo_path: Path, treeish: str, pathspec: str) -> dict[str, FileInfo]:
+    """一次 `git ls-tree -r -l` 读取提交中 pathspec 下的文件，返回 {仓库相对路径: (size, blob)}。"""
+    result = run_git(["ls-tree", "-r", "-l", "-z", treeish, "--", pathspec], cwd=repo_path)
+    files: dict[str, FileInfo] = {}
+    for record in filter(None, result.stdout.split("\0")):
+        # "<mode> <type> <blob> <size>\t<path>"
+        meta, path = record.split("\t", 1)
+        mode, obj_type, blob, size = meta.split()
+        if obj_type == "blob" and mode in ("100644", "100755"):
+            files[path] = FileInfo(int(size), blob)
+    return files
+
+
+@timed_phase("hash")
+def load_tree_ids(repo_path: Path, treeish: str, pathspec: str) -> dict[str, str]:
+    """一次 `git ls-tree -r -d` 读取提交中 pathspec 及其下所有目录的树 ID，返回 {仓库相对路径: 树 ID}。"""
+    result = run_git(["ls-tree", "-r", "-d", "-z", treeish, "--", pathspec], cwd=repo_path)
+    trees: dict[str, str] = {}
+    for record in filter(None, result.stdout.split("\0")):
+        # "<mode> tree <tree>\t<path>"
+        meta, path = record.split("\t", 1)
+        trees[path] = meta.split()[2]
+    return trees
+
+
+def resolve_base_commit(repo_path: Path, base_branch: str, fetch: bool = False) -> str:
+    """返回 origin/<base_branch> 的提交 ID；fetch=True 或远端跟踪分支不存在时先 fetch。"""
+    ref = f"refs/remotes/origin/{base_branch}"
+    if not fetch:
+        result = run_git(["rev-parse", "--verify", "--quiet", ref], cwd=repo_path, check=False)
+        if result.returncode == 0:
+            return result.stdout.strip()
+    run_git(["fetch", "origin", f"{base_branch}:{ref}"], cwd=repo_path)
+    return run_git(["rev-parse", "--verify", ref], cwd=repo_path).stdout.strip()
+
+
+def make_sync_branch_name() -> str:
+    timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    return f"sync/persona-update-{timestamp}"
+
+
+def build_commit_message(commit_message: str, items: list[str]) -> str:
+    return (
+        f"{commit_message}\n\nSynced items:\n"
+        + "\n".join(f"- {item}" for item in items)
+    )
+
+
+@timed_phase("commit")
+def commit_with_private_index(
+    repo_path: Path,
+    base_commit: str,
+    changes: list[StagedChange],
+    message: str,
+    index_file: Path,
+    manifest: HashManifest | None = None,
+) -> str | None:
+    """
+    不切换分支、不触碰工作区，直接由变更文件构造提交：
+    临时 GIT_INDEX_FILE ← read-tree base → hash-object -w → update-index → write-tree → commit-tree。
+    hash-object 返回的 blob ID 记入 manifest。返回新提交 ID；结果树与 base 相同时返回 None。
+    """
+    env = {"GIT_INDEX_FILE": str(index_file)}
+    index_file.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        run_git(["read-tree", base_commit], cwd=repo_path, env=env)
+
+        writes = [c for c in changes if c.src is not None]
+        blobs: list[str] = []
+        if writes:
+            # 先 stat 再由 git 读取：读取期间被修改的文件，下次运行的 stat 签名必然不同
+            stats = [os.stat(c.src) for c in writes]
+            # 一个 hash-object 进程批量写入所有 blob；--no-filters 与进程内的 blob 摘要保持一致
+            result = run_git(
+                ["hash-object", "-w", "--no-filters", "--stdin-paths"],
+                cwd=repo_path,
+                input="".join(f"{c.src}\n" for c in writes),
+            )
+            blobs = result.stdout.split()
+            METRICS.add(bytes_copied=sum(st.st_size for st in stats))
+            if manifest is not None:
+                for c, st, blob in zip(writes, stats, blobs):
+                    manifest.store(str(c.src), st, blob)
+
+        index_info = [
+            f"{'100755' if os.access(c.src, os.X_OK) else '100644'} {blob}\t{c.path}\n"
+            for c, blob in zip(writes, blobs)
+        ]
+        index_info += [f"0 {'0' * 40}\t{c.path}\n" for c in changes if c.src is None]
+        run_git(["update-index", "--index-info"], cwd=repo_path, env=env, input="".join(index_info))
+
+        tree = run_git(["write-tree"], cwd=repo_path, env=env).stdout.strip()
+        base_tree = run_git(["rev-parse", f"{base_commit}^{{tree}}"], cwd=repo_path).stdout.strip()
+        if tree == base_tree:
+            return None
+        commit = run_git(
+            ["commit-tree", tree, "-p", base_commit, "-F", "-"], cwd=repo_path, input=message
+        ).stdout.strip()
+    finally:
+        index_file.unlink(missing_ok=True)
+    logger.info(f"Built commit {commit[:12]} on {base_commit[:12]} via private index ({len(changes)} file(s))")
+    return commit
+
+
+@timed_phase("commit")
 def create_sync_branch(repo_path: Path, base_branch: str) -> str:
     """切到 base_branch、拉取最新、再创建时间戳同步分支，返回分支名。"""
-    timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
-    branch_name = f"sync/persona-update-{timestamp}"
+    branch_name = make_sync_branch_name()
 
     run_git(["checkout", base_branch], cwd=repo_path)
     run_git(["pull", "origin", base_branch], cwd=repo_path)
@@ -223,31 +1752,74 @@ def create_sync_branch(repo_path: Path, base_branch: str) -> str:
     return branch_name
 
 
-def commit_changes(repo_path: Path, commit_message: str, items: list[str]) -> bool:
-    """
-    提交工作区所有更改。
-    返回 True 表示成功提交；False 表示没有可提交的内容。
+@timed_phase("commit")
+def commit_changes(
+    repo_path: Path, commit_message: str, items: list[str], paths: list[str] | None = None
+) -> bool:
     """
-    if not has_uncommitted_changes(repo_path):
-        logger.info("No changes to commit.")
-        return False
+    提交更改。返回 True 表示成功提交；False 表示没有可提交的内容。
 
-    run_git(["add", "-A"], cwd=repo_path)
-    full_message = (
-        f"{commit_message}\n\nSynced items:\n"
-        + "\n".join(f"- {item}" for item in items)
+    给定 paths（本次同步写入/删除的仓库相对路径）时只暂存并提交这些路径：
+    update-index 只 stat 这些文件，diff-index --cached 只比较 HEAD 与索引，
+    耗时与仓库大小无关，也不会带上工作区中与同步无关的改动。
+    与 add -A 一样跳过命中忽略规则的未跟踪路径（drop_ignored_paths）。
+    未给定时提交工作区所有更改（status + add -A）。
+    """
+    t0 = time.perf_counter()
+    if paths is None:
+        if not has_uncommitted_changes(repo_path):
+            logger.info("No changes to commit.")
+            return False
+        run_git(["add", "-A"], cwd=repo_path)
+        t_staged = time.perf_counter()
+        run_git(["commit", "-m", build_commit_message(commit_message, items)], cwd=repo_path)
+    else:
+        paths = drop_ignored_paths(repo_path, paths)
+        run_git(
+            ["update-index", "--add", "--remove", "-z", "--stdin"],
+            cwd=repo_path,
+            input="".join(f"{path}\0" for path in paths),
+        )
+        wanted = set(paths)
+        in_index = [
+            path
+            for path in run_git(
+                ["diff-index", "--cached", "--name-only", "-z", "HEAD"], cwd=repo_path
+            ).stdout.split("\0")
+            if path
+        ]
+        staged = [path for path in in_index if path in wanted]
+        if not staged:
+            logger.info("No changes to commit.")
+            return False
+        t_staged = time.perf_counter()
+        message = build_commit_message(commit_message, items)
+        if len(staged) == len(in_index):
+            run_git(["commit", "-m", message], cwd=repo_path)
+        else:
+            # 索引中另有人工暂存的内容：带路径提交（--only），不把它们混入同步提交
+            run_git(
+                ["commit", "-m", message, "--pathspec-from-file=-", "--pathspec-file-nul"],
+                cwd=repo_path,
+                input="".join(f"{path}\0" for path in staged),
+            )
+    t_done = time.perf_counter()
+    scope = "full worktree" if paths is None else f"{len(paths)} path(s)"
+    logger.info(
+        f"Committed: {commit_message} (git stage {(t_staged - t0) * 1000:.0f} ms, "
+        f"commit {(t_done - t_staged) * 1000:.0f} ms, {scope})"
     )
-    run_git(["commit", "-m", full_message], cwd=repo_path)
-    logger.info(f"Committed: {commit_message}")
     return True
 
 
+@timed_phase("push")
 def push_branch(repo_path: Path, branch_name: str) -> None:
     """推送分支到 origin。"""
     run_git(["push", "-u", "origin", branch_name], cwd=repo_path)
     logger.info(f"Pushed branch: {branch_name}")
 
 
+@timed_phase("pr_create")
 def create_pr(repo_path: Path, branch_name: str, title: str, body: str, base: str) -> str:
     """创建 Pull Request，返回 PR URL。"""
     result = run_gh(
@@ -259,6 +1831,7 @@ def create_pr(repo_path: Path, branch_name: str, title: str, body: str, base: st
     return pr_url
 
 
+@timed_phase("merge")
 def merge_pr(repo_path: Path, branch_name: str) -> bool:
     """合并 PR 并删除远端分支。返回 True 表示成功。"""
     try:
@@ -270,29 +1843,643 @@ def merge_pr(repo_path: Path, branch_name: str) -> bool:
         return False
 
 
+@timed_phase("pr_create")
+def find_open_pr(repo_path: Path, branch_name: str) -> dict[str, Any] | None:
+    """返回 head 为 branch_name 的未关闭 PR（含 number、url），不存在时返回 None。"""
+    result = run_gh(
+        ["pr", "list", "--head", branch_name, "--state", "open", "--json", "number,url", "--limit", "1"],
+        cwd=repo_path,
+    )
+    prs = json.loads(result.stdout or "[]")
+    return prs[0] if prs else None
+
+
+@timed_phase("merge")
+def get_pr_state(repo_path: Path, branch_name: str) -> str:
+    """返回 head 为 branch_name 的最近一个 PR 的状态（OPEN / MERGED / CLOSED）。"""
+    result = run_gh(["pr", "view", branch_name, "--json", "state"], cwd=repo_path)
+    return json.loads(result.stdout or "{}").get("state", "")
+
+
+def format_pr_body(config: dict[str, Any], items: list[str]) -> str:
+    """按 git.pr_body_template 生成 PR 正文，items 逐行列出。"""
+    pr_body_tpl = config.get("git", {}).get(
+        "pr_body_template",
+        "Automated sync of persona files from Raspberry Pi workspace.\n\nSynced items:\n{synced_items}\n\n---\n*Created automatically by openclaw_sync.py*",
+    )
+    return pr_body_tpl.format(synced_items="\n".join(f"- `{i}`" for i in items))
+
+
+@timed_phase("pr_create")
+def update_pr_body(repo_path: Path, pr_number: int, body: str) -> None:
+    """更新已有 PR 的正文。"""
+    run_gh(["pr", "edit", str(pr_number), "--body", body], cwd=repo_path)
+    logger.info(f"Updated PR #{pr_number}")
+
+
+def read_git_blob(repo_path: Path, blob: str) -> bytes:
+    """读取对象库中 blob 的原始内容。"""
+    result = subprocess.run(
+        [GIT_BIN, "cat-file", "blob", blob], cwd=repo_path, capture_output=True, check=True
+    )
+    return result.stdout
+
+
+def resolve_remote_branch(repo_path: Path, branch_name: str) -> str | None:
+    """fetch 远端分支并返回其提交 ID；远端不存在该分支时清理跟踪引用并返回 None。"""
+    ref = f"refs/remotes/origin/{branch_name}"
+    result = run_git(["fetch", "origin", f"+{branch_name}:{ref}"], cwd=repo_path, check=False)
+    if result.returncode != 0:
+        run_git(["update-ref", "-d", ref], cwd=repo_path, check=False)
+        return None
+    return run_git(["rev-parse", "--verify", ref], cwd=repo_path).stdout.strip()
+
+
 def cleanup_local_branch(repo_path: Path, branch_name: str, default_branch: str) -> None:
     """切回默认分支并删除本地临时分支。"""
     run_git(["checkout", default_branch], cwd=repo_path)
     run_git(["branch", "-D", branch_name], cwd=repo_path, check=False)
 
 
+def delete_local_branch_ref(repo_path: Path, branch_name: str) -> None:
+    """删除 private_index 模式创建的本地分支（该分支从未被检出，无需切换）。"""
+    run_git(["branch", "-D", branch_name], cwd=repo_path, check=False)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Stat Pre-check
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _stat_signature(path: str) -> tuple[int, int, int]:
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns, st.st_ino
+
+
+def _update_stat_digest(h: Any, path: str, rules: ItemFilter | None = None, rel: str = "") -> None:
+    """把 path（目录则递归）的 stat 签名依次写入哈希对象，不读取文件内容；跳过被 rules 排除的路径。"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        h.update(b"-\n")
+        return
+    h.update(f"{st.st_mode:o} {st.st_size} {st.st_mtime_ns} {st.st_ino}\n".encode())
+    if S_ISDIR(st.st_mode):
+        with os.scandir(path) as it:
+            entries = sorted((entry.name, entry.is_dir()) for entry in it)
+        for name, is_dir in entries:
+            child_rel = f"{rel}/{name}" if rel else name
+            if rules is not None and rules.excludes(child_rel, is_dir):
+                continue
+            h.update(name.encode("utf-8", "surrogateescape") + b"/")
+            _update_stat_digest(h, os.path.join(path, name), rules, child_rel)
+
+
+def compute_stat_digest(jobs: list[tuple[str, str, list[Any]]], target: bool = False) -> str:
+    """对每个任务 (source_dir, target_dir, 同步项配置) 的源端（target=True 时为目标端）做一次 stat 遍历，返回组合摘要。"""
+    h = hashlib.md5()
+    for source_dir, target_dir, specs in jobs:
+        root = target_dir if target else source_dir
+        h.update(f"{root}\0".encode())
+        for item in map(parse_sync_item, specs):
+            h.update(item.path.encode() + b"\0")
+            _update_stat_digest(h, os.path.join(root, item.path), item.rules)
+    return h.hexdigest()
+
+
+def get_precheck_jobs(config: dict[str, Any]) -> list[tuple[str, str, list[Any]]]:
+    """快照中缓存的任务列表：(source_dir, target_dir, 同步项原始配置)，预检时无需解析 YAML。"""
+    return [
+        (
+            str(Path(job["source_dir"]).expanduser().resolve()),
+            str(PROJECT_ROOT / "personas" / job["target_subdir"]),
+            [item.spec for item in job["sync_items"]],
+        )
+        for job in get_sync_jobs(config)
+    ]
+
+
+def save_precheck_snapshot(config_path: Path, config: dict[str, Any], source_digest: str | None) -> None:
+    """
+    记录 stat 快照。只应由扫描后未发现需要同步的变更的运行调用。
+
+    source_digest 必须在扫描源目录之前取得：扫描期间及之后（推送、合并、拉回期间）
+    对源目录的编辑会让它与下一次预检的结果不同，不会被误记为已同步。目标端在保存时计算。
+    """
+    if source_digest is None:
+        return
+    jobs = get_precheck_jobs(config)
+    snapshot = {
+        "version": PRECHECK_VERSION,
+        "config": str(config_path.resolve()),
+        "config_sig": _stat_signature(str(config_path)),
+        "jobs": jobs,
+        "source_digest": source_digest,
+        "target_digest": compute_stat_digest(jobs, target=True),
+    }
+    try:
+        PRECHECK_FILE.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = PRECHECK_FILE.with_name(PRECHECK_FILE.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f)
+        os.replace(tmp_path, PRECHECK_FILE)
+    except OSError as e:
+        logger.warning(f"Failed to save pre-check snapshot (non-fatal): {e}")
+
+
+def precheck_unchanged(config_path: Path) -> bool:
+    """
+    快速路径：不解析 YAML，仅用快照中缓存的路径做 stat 比对。
+    配置文件本身或任一同步项的 stat 签名变化都返回 False。
+    """
+    try:
+        with open(PRECHECK_FILE, "r", encoding="utf-8") as f:
+            snapshot = json.load(f)
+        if snapshot.get("version") != PRECHECK_VERSION:
+            return False
+        if snapshot["config"] != str(config_path.resolve()):
+            return False
+        if list(_stat_signature(str(config_path))) != snapshot["config_sig"]:
+            return False
+        if compute_stat_digest(snapshot["jobs"]) != snapshot["source_digest"]:
+            return False
+        return compute_stat_digest(snapshot["jobs"], target=True) == snapshot["target_digest"]
+    except (OSError, ValueError, KeyError):
+        return False
+
+
+def elapsed_ms(since: float = _STARTUP_T0) -> float:
+    return (time.perf_counter() - since) * 1000
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Single Instance Lock
+# ─────────────────────────────────────────────────────────────────────────────
+
+class RunLock:
+    """
+    <log_dir> 下的 flock 排他锁，保证同一时间只有一个实例在同步。
+
+    进程退出（包括被 kill）时内核自动释放锁，不会留下需要手动清理的陈旧锁。
+    拿不到锁的实例调用 request_rerun 留下重跑标记，由持锁实例在结束前处理。
+    """
+
+    def __init__(self, log_dir: Path) -> None:
+        self.path = log_dir / LOCK_FILE
+        self.rerun_flag = log_dir / RERUN_FILE
+        self._fd: int | None = None
+
+    def acquire(self, blocking: bool = False) -> bool:
+        import fcntl
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        # 记录持锁进程，便于其他实例在日志中说明是谁在运行
+        os.ftruncate(fd, 0)
+        os.write(fd, f"{os.getpid()}\n".encode())
+        self._fd = fd
+        return True
+
+    def release(self) -> None:
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def holder(self) -> str:
+        try:
+            return self.path.read_text(encoding="utf-8").strip() or "?"
+        except OSError:
+            return "?"
+
+    def request_rerun(self) -> None:
+        self.rerun_flag.touch()
+
+    def take_rerun_request(self) -> bool:
+        """清除重跑标记，返回此前是否有重跑请求。"""
+        try:
+            self.rerun_flag.unlink()
+            return True
+        except FileNotFoundError:
+            return False
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Sync Journal
+# ─────────────────────────────────────────────────────────────────────────────
+
+class SyncJournal:
+    """
+    <log_dir> 下的流水线状态：hashed → copied → committed → pushed → pr_opened → merged → notified。
+
+    每完成一步立即原子写盘；流程走完（或确认无需继续）后删除。下次运行读到未完成的日志时，
+    从最后完成的一步继续，复用已有分支与 PR，而不是重新建分支、推送、开 PR。
+    """
+
+    def __init__(self, path: Path, state: dict[str, Any] | None = None) -> None:
+        self.path = path
+        self.state: dict[str, Any] = state or {}
+
+    @classmethod
+    def load(cls, path: Path) -> SyncJournal:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return cls(path)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable sync journal {path}: {e}")
+            return cls(path)
+        if state.get("version") != JOURNAL_VERSION or state.get("stage") not in JOURNAL_STAGES:
+            logger.warning(f"Ignoring sync journal with unknown version/stage: {path}")
+            return cls(path)
+        return cls(path, state)
+
+    @property
+    def stage(self) -> str | None:
+        return self.state.get("stage")
+
+    def reached(self, stage: str) -> bool:
+        """是否已完成 stage（或更靠后的步骤）。"""
+        return self.stage is not None and JOURNAL_STAGES.index(self.stage) >= JOURNAL_STAGES.index(stage)
+
+    def advance(self, stage: str, **fields: Any) -> None:
+        """记录已完成 stage 并写盘；fields 合并进状态（分支名、PR 地址等）。"""
+        now = datetime.now().isoformat(timespec="seconds")
+        self.state.setdefault("version", JOURNAL_VERSION)
+        self.state.setdefault("started", now)
+        self.state.update(fields, stage=stage, updated=now)
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_name(self.path.name + ".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.state, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Failed to save sync journal (non-fatal): {e}")
+
+    def clear(self) -> None:
+        self.state = {}
+        self.path.unlink(missing_ok=True)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Watch Mode (inotify)
+# ─────────────────────────────────────────────────────────────────────────────
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (
+    IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+    | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+)
+
+
+class InotifyWatcher:
+    """
+    基于 Linux inotify 的目录监听（通过 ctypes 调用 libc，无第三方依赖）。
+
+    各任务的 source_dir 本身只做非递归监听并按同步项名称过滤：everything_openclaw
+    仓库通常就克隆在 workspace 里，递归监听会把自己的 git 写入当成变更。
+    目录型同步项递归监听，新建的子目录会自动补加 watch；被过滤规则排除的
+    子目录不加 watch，被排除文件上的事件直接丢弃。
+    """
+
+    def __init__(self, sources: list[tuple[Path, list[SyncItem]]]) -> None:
+        import ctypes
+        import ctypes.util
+
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        # source_dir → 该目录下需要关心的顶层名称（多个任务可共用同一 source_dir）
+        self.top_names: dict[Path, set[str]] = {}
+        for source_dir, items in sources:
+            self.top_names.setdefault(source_dir, set()).update(Path(i.path).parts[0] for i in items)
+        # 带过滤规则的目录型同步项：(同步项根目录, 规则)
+        self.item_rules = [
+            (source_dir / item.path, item.rules)
+            for source_dir, items in sources
+            for item in items
+            if item.rules is not None
+        ]
+        self.watches: dict[int, Path] = {}
+        for source_dir, items in sources:
+            self._add_watch(source_dir)
+            for item in items:
+                if (source_dir / item.path).is_dir():
+                    self.add_tree(source_dir / item.path)
+
+    def _add_watch(self, path: Path) -> None:
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd >= 0:
+            self.watches[wd] = path
+
+    def add_tree(self, root: Path) -> None:
+        """递归监听 root 及其所有未被排除的子目录。"""
+        for dirpath, dirnames, _ in os.walk(root):
+            dirnames[:] = [d for d in dirnames if not self._is_excluded(Path(dirpath) / d, True)]
+            self._add_watch(Path(dirpath))
+
+    def _is_excluded(self, path: Path, is_dir: bool) -> bool:
+        for root, rules in self.item_rules:
+            if path != root and path.is_relative_to(root):
+                return not rules.allows(path.relative_to(root).as_posix(), is_dir)
+        return False
+
+    def _is_relevant(self, wd_path: Path, name: str, is_dir: bool) -> bool:
+        # source_dir 顶层事件只关心同步项本身；同步项目录内的事件除被过滤规则排除的外一律相关
+        if wd_path in self.top_names:
+            return name in self.top_names[wd_path]
+        return not (name and self._is_excluded(wd_path / name, is_dir))
+
+    def read_events(self, timeout: float | None) -> list[tuple[Path, int]]:
+        """等待最多 timeout 秒，返回相关事件 (路径, mask) 列表；超时返回空列表。"""
+        import select
+        import struct
+
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        events: list[tuple[Path, int]] = []
+        offset = 0
+        while offset + 16 <= len(data):
+            wd, mask, _, name_len = struct.unpack_from("iIII", data, offset)
+            raw_name = data[offset + 16 : offset + 16 + name_len].rstrip(b"\0")
+            offset += 16 + name_len
+            name = os.fsdecode(raw_name)
+
+            if mask & IN_Q_OVERFLOW:
+                # 事件队列溢出：无法知道丢了什么，当作整体变化处理
+                events.append((Path("/"), mask))
+                continue
+            if mask & IN_IGNORED:
+                self.watches.pop(wd, None)
+                continue
+            wd_path = self.watches.get(wd)
+            if wd_path is None or not self._is_relevant(wd_path, name, bool(mask & IN_ISDIR)):
+                continue
+
+            path = wd_path / name if name else wd_path
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                self.add_tree(path)
+            events.append((path, mask))
+        return events
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+def watch_sync(config: dict[str, Any], args: argparse.Namespace) -> int:
+    """
+    常驻 watch 模式：先完整同步一次，之后每当 inotify 事件在防抖窗口内静默，
+    就把这一批变更合并成一次 同步 → 提交 → PR 流程。
+    """
+    import signal
+
+    watch_cfg = config.get("watch", {})
+    debounce = args.debounce or float(watch_cfg.get("debounce_seconds", DEFAULT_DEBOUNCE_SECONDS))
+    max_delay = float(watch_cfg.get("max_delay_seconds", DEFAULT_MAX_DELAY_SECONDS))
+    sources = [
+        (Path(job["source_dir"]).expanduser().resolve(), job["sync_items"])
+        for job in get_sync_jobs(config)
+    ]
+
+    def _stop(signum: int, frame: Any) -> None:
+        raise KeyboardInterrupt
+
+    # systemd/kill 发送的 SIGTERM 与 Ctrl-C 一样正常退出
+    signal.signal(signal.SIGTERM, _stop)
+
+    try:
+        watcher = InotifyWatcher(sources)
+    except (OSError, AttributeError) as e:
+        logger.error(f"inotify unavailable, cannot watch: {e}")
+        return 1
+
+    # 常驻进程整个生命周期持有锁；启动时若有 cron 触发的运行尚未结束，等它完成
+    lock = RunLock(get_log_dir(config))
+    if not lock.acquire():
+        logger.info(f"Another sync run is in progress (pid {lock.holder()}); waiting for it to finish")
+        lock.acquire(blocking=True)
+
+    logger.info(
+        f"Watching {', '.join(str(src) for src, _ in sources)} ({len(watcher.watches)} dir(s)); "
+        f"debounce {debounce:.1f}s, max delay {max_delay:.0f}s"
+    )
+    lock.take_rerun_request()
+    exit_code = run_sync(config, args)
+
+    try:
+        while True:
+            events = watcher.read_events(timeout=None)
+            if not events:
+                continue
+            # 收集一批：直到静默 debounce 秒，或距首个事件超过 max_delay 秒
+            batch_start = time.monotonic()
+            n_events = len(events)
+            while True:
+                remaining = max_delay - (time.monotonic() - batch_start)
+                if remaining <= 0:
+                    break
+                more = watcher.read_events(timeout=min(debounce, remaining))
+                if not more:
+                    break
+                n_events += len(more)
+            logger.info(
+                f"Change batch: {n_events} event(s) over {time.monotonic() - batch_start:.1f}s — syncing"
+            )
+            # 本轮同步覆盖此前的所有重跑请求
+            lock.take_rerun_request()
+            exit_code = run_sync(config, args)
+    except KeyboardInterrupt:
+        logger.info("Watch mode stopped.")
+    finally:
+        watcher.close()
+        lock.release()
+    return exit_code
+
+
 # ─────────────────────────────────────────────────────────────────────────────
 # Main Sync Logic
 # ─────────────────────────────────────────────────────────────────────────────
 
-def sync_items(config: dict[str, Any], dry_run: bool = False) -> list[str]:
+class ItemPlan(NamedTuple):
+    """sync_items 第一步的遍历结果：单个同步项两端的文件列表、被过滤掉的路径及整棵跳过的未变子目录。"""
+    item: str
+    src_path: Path
+    dst_path: Path
+    src_list: list[tuple[str, str, os.stat_result | None]]
+    dst_list: list[tuple[str, str, os.stat_result | None]]
+    rules: ItemFilter | None
+    skipped: list[SkippedPath]
+    normalizer: Normalizer | None
+    unchanged: set[str]
+
+
+def report_skipped(item: str, skipped: list[SkippedPath], dry_run: bool) -> None:
+    """dry-run 时逐条列出被过滤的路径及因此免于读取的字节数；否则只记一条 debug 日志。"""
+    if not skipped:
+        return
+    if not dry_run:
+        logger.debug(f"Filtered out of {item}: {len(skipped)} path(s)")
+        return
+    sizes = [path_size(s.path) for s in skipped]
+    logger.info(f"[DRY RUN] Skipped in {item}: {len(skipped)} path(s), {format_bytes(sum(sizes))} not read")
+    for s, size in zip(skipped, sizes):
+        logger.info(f"[DRY RUN]   ! {s.rel} ({s.reason}, {format_bytes(size)})")
+
+
+def drop_semantic_noops(
+    normalizer: Normalizer,
+    modified: list[str],
+    src_path: Path,
+    dst_path: Path,
+    src_files: dict[str, FileInfo],
+    dst_files: dict[str, FileInfo],
+    manifest: HashManifest | None,
+    from_tree: bool,
+) -> list[str]:
+    """
+    从已修改的文件中去掉归一化后与目标相同的（只改了空白/换行、易变行或 frontmatter 键顺序），
+    返回仍有语义变化的文件。目标端内容取自工作区文件，与记录的 blob 不一致时改从对象库读取。
+    """
+    kept: list[str] = []
+    for rel in modified:
+        src = src_path / rel if rel else src_path
+        dst = dst_path / rel if rel else dst_path
+        dst_raw = dst_files[rel].digest or ""
+
+        def read_dst() -> bytes:
+            if not from_tree:
+                try:
+                    data = dst.read_bytes()
+                    if blob_digest(data) == dst_raw:
+                        return data
+                except OSError:
+                    pass
+            return read_git_blob(PROJECT_ROOT, dst_raw)
+
+        try:
+            src_raw = src_files[rel].digest or calculate_file_hash(src, manifest)
+            same = normalized_digest(normalizer, src_raw, src.read_bytes, manifest) == normalized_digest(
+                normalizer, dst_raw, read_dst, manifest
+            )
+        except (OSError, subprocess.CalledProcessError) as e:
+            logger.debug(f"Cannot normalize {src}, treating as changed: {e}")
+            same = False
+        if not same:
+            kept.append(rel)
+    return kept
+
+
+def _stage_item_changes(
+    item: str,
+    src_path: Path,
+    repo_prefix: str,
+    changes: DirChanges,
+    staged: list[StagedChange],
+    dry_run: bool,
+) -> bool:
+    """private_index 模式：不写工作区，只把文件级变更记入 staged。返回是否有变更。"""
+    n_changed = len(changes.added) + len(changes.modified) + len(changes.deleted)
+    summary = (
+        f"{len(changes.added)} added, {len(changes.modified)} modified, "
+        f"{len(changes.deleted)} deleted — {format_bytes(changes.bytes_to_write)} to write, "
+        f"{format_bytes(changes.bytes_skipped)} skipped"
+    )
+    logger.info(f"{'[DRY RUN] ' if dry_run else ''}Staged: {item} ({summary})")
+
+    for rel_path in changes.added + changes.modified:
+        src = src_path / rel_path if rel_path else src_path
+        staged.append(StagedChange(f"{repo_prefix}/{rel_path}" if rel_path else repo_prefix, src))
+    for rel_path in changes.deleted:
+        staged.append(StagedChange(f"{repo_prefix}/{rel_path}" if rel_path else repo_prefix, None))
+    return n_changed > 0
+
+
+def sync_items(
+    config: dict[str, Any],
+    dry_run: bool = False,
+    workers: int | None = None,
+    base_commit: str | None = None,
+    staged: list[StagedChange] | None = None,
+    job: dict[str, Any] | None = None,
+    manifest: HashManifest | None = None,
+    executor: Executor | None = None,
+    item_prefix: str = "",
+    written: list[str] | None = None,
+) -> list[str]:
     """
     执行文件同步，返回实际发生变化的项目列表。
     未变化的项目直接跳过（不产生 PR）。
+
+    分三步：stat 遍历收集所有同步项两端的文件 → 线程池统一哈希 →
+    按配置顺序逐项对比并复制（目录内的文件复制同样走线程池）。
+    遍历时顺带比较两端的目录树 ID（按 stat 指纹缓存在清单中，目标端也可取自提交中的树），
+    一致的目录项或子目录不再哈希和对比：只改动一个子目录时其余子目录都直接跳过。
+    源文件只在与目标大小相同时才需要摘要：memory/ 下只追加写入的日志文件
+    大小必然变化，直接判定为已修改，不读取内容。
+
+    给定 base_commit 时（private_index 模式）目标端取自该提交的树而非工作区，
+    变更不写入工作区，而是以 StagedChange 追加到 staged。
+
+    job 指定单个同步任务（默认取顶层 source_dir/target_subdir/sync_items）；
+    manifest、executor 由 sync_jobs 在多个任务间共享，未提供时本函数自行创建。
+    给定 written 时追加工作区中实际写入或删除的文件（仓库相对路径），供提交时限定范围。
     """
-    source_dir = Path(config["source_dir"]).expanduser().resolve()
-    target_subdir = config["target_subdir"]
-    items_cfg = config["sync_items"]
+    job = job or get_sync_jobs(config)[0]
+    source_dir = Path(job["source_dir"]).expanduser().resolve()
+    target_subdir = job["target_subdir"]
+    items_cfg = job["sync_items"]
 
     target_dir = PROJECT_ROOT / "personas" / target_subdir
+    target_rel = target_dir.relative_to(PROJECT_ROOT).as_posix()
     synced: list[str] = []
-
-    for item in items_cfg:
+    owns_manifest = manifest is None
+    if manifest is None:
+        manifest = HashManifest.load(get_log_dir(config) / MANIFEST_FILE)
+    workers = workers or get_workers(config)
+    tree_files = load_tree_files(PROJECT_ROOT, base_commit, target_rel) if base_commit else None
+    tree_ids = load_tree_ids(PROJECT_ROOT, base_commit, target_rel) if base_commit else None
+    # 目标端都是本仓库已跟踪的文件：直接取索引里的 blob ID，不再读取内容
+    index_blobs = {} if tree_files is not None else load_index_blobs(PROJECT_ROOT, target_rel)
+
+    def base_tree_digests(dst_path: Path) -> dict[str, str]:
+        """base_commit 中该目录及其子目录的树 ID，键为相对 dst_path 的路径（自身为 ""）。"""
+        repo_prefix = dst_path.relative_to(PROJECT_ROOT).as_posix()
+        return {
+            path[len(repo_prefix) + 1:]: tree
+            for path, tree in (tree_ids or {}).items()
+            if path == repo_prefix or path.startswith(repo_prefix + "/")
+        }
+
+    # ── 1. 遍历：收集每个同步项源/目标两端的文件列表 ─────────────────────────
+    plans: list[ItemPlan] = []
+    for sync_item in items_cfg:
+        item, rules = sync_item.path, sync_item.rules
         src_path = source_dir / item
         dst_path = target_dir / item
 
@@ -300,61 +2487,594 @@ def sync_items(config: dict[str, Any], dry_run: bool = False) -> list[str]:
             logger.warning(f"Source item does not exist, skipping: {src_path}")
             continue
 
-        src_hash = get_item_hash(src_path)
-        dst_hash = get_item_hash(dst_path) if dst_path.exists() else ""
+        # 遍历时顺带算出两端各目录的树 ID（只用已知摘要，不读取内容），一致的子目录不再对比；
+        # 过滤与归一化改变了比较对象，这类项目不做此判断
+        prunable = src_path.is_dir() and rules is None and sync_item.normalizer is None
+        src_digests: dict[str, str] | None = {} if prunable else None
+        dst_digests: dict[str, str] | None = {} if prunable else None
 
-        if src_hash == dst_hash and dst_hash:
-            logger.debug(f"Unchanged, skipping: {item}")
+        skipped: list[SkippedPath] = []
+        if src_path.is_dir():
+            src_list = list_dir_files(src_path, rules, skipped, src_digests, manifest)
+        else:
+            src_list = [("", str(src_path), None)]
+        if tree_files is not None:
+            dst_list = []
+            if prunable:
+                dst_digests = base_tree_digests(dst_path)
+        elif src_path.is_dir():
+            # 目标端使用相同规则：被排除的路径不受同步管理，已存在的也不会被删除
+            dst_list = (
+                list_dir_files(
+                    dst_path, rules, digests=dst_digests, manifest=manifest, blobs=index_blobs, only=src_digests
+                )
+                if dst_path.is_dir()
+                else []
+            )
+        else:
+            dst_list = [("", str(dst_path), None)] if dst_path.is_file() else []
+
+        unchanged = unchanged_subtrees(src_digests, dst_digests) if src_digests and dst_digests else set()
+        if "" in unchanged:
+            logger.debug(f"{item_prefix}{item}: tree unchanged, skipped")
             continue
+        if unchanged:
+            src_list = drop_subtrees(src_list, unchanged)
+            dst_list = drop_subtrees(dst_list, unchanged)
+        plans.append(
+            ItemPlan(item, src_path, dst_path, src_list, dst_list, rules, skipped, sync_item.normalizer, unchanged)
+        )
 
-        if copy_item(src_path, dst_path, dry_run=dry_run):
-            synced.append(item)
-            if not dry_run:
-                logger.info(f"Synced: {item}")
+    # 目录项的 stat 已由 list_dir_files 取得（st 非 None），这里不再重复 stat
+    def dst_file_info(path: str, st: os.stat_result | None) -> FileInfo | None:
+        blob = index_blobs.get(path)
+        if blob is None:
+            return get_file_info(path, manifest, st)
+        if st is None:
+            try:
+                st = os.stat(path)
+            except OSError:
+                return None
+            METRICS.add(files_stated=1)
+        return FileInfo(st.st_size, blob)
+
+    def src_file_info(
+        path: str, st: os.stat_result | None, dst_info: FileInfo | None, size_limit: int | None
+    ) -> FileInfo | None:
+        try:
+            if st is None:
+                st = os.stat(path)
+                METRICS.add(files_stated=1)
+            if dst_info is None or dst_info.size != st.st_size:
+                return FileInfo(st.st_size, None)
+            if size_limit is not None and st.st_size > size_limit:
+                return FileInfo(st.st_size, None)  # 超过上限，第 3 步会跳过
+            return FileInfo(st.st_size, calculate_file_hash(path, manifest, st))
+        except OSError:
+            return None
+
+    with shared_or_new_pool(executor, workers) as pool:
+        # ── 2. 哈希：先取目标端，再只对大小相同的源文件计算摘要，结果顺序确定 ──
+        with METRICS.phase("hash"):
+            dst_entries = [(path, st) for plan in plans for _, path, st in plan.dst_list]
+            dst_paths = [path for path, _ in dst_entries]
+            dst_infos = dict(zip(dst_paths, pool.map(lambda e: dst_file_info(*e), dst_entries)))
+
+            plan_dst_files: list[dict[str, FileInfo]] = []
+            for plan in plans:
+                repo_prefix = plan.dst_path.relative_to(PROJECT_ROOT).as_posix()
+                if tree_files is None:
+                    dst_files = {rel: dst_infos[p] for rel, p, _ in plan.dst_list if dst_infos[p] is not None}
+                elif plan.src_path.is_dir():
+                    dir_prefix = repo_prefix + "/"
+                    dst_files = {
+                        path[len(dir_prefix):]: info
+                        for path, info in tree_files.items()
+                        if path.startswith(dir_prefix)
+                        and (plan.rules is None or plan.rules.allows(path[len(dir_prefix):]))
+                        and not in_subtrees(path[len(dir_prefix):], plan.unchanged)
+                    }
+                else:
+                    dst_files = {"": tree_files[repo_prefix]} if repo_prefix in tree_files else {}
+                plan_dst_files.append(dst_files)
+
+            src_jobs = [
+                (path, st, dst_files.get(rel), plan.rules.max_file_size if plan.rules else None)
+                for plan, dst_files in zip(plans, plan_dst_files)
+                for rel, path, st in plan.src_list
+            ]
+            src_infos = dict(
+                zip((job[0] for job in src_jobs), pool.map(lambda job: src_file_info(*job), src_jobs))
+            )
+        n_from_index = sum(1 for p in dst_paths if p in index_blobs)
+        if tree_files is not None:
+            n_from_index = len(tree_files)
+        n_by_size = sum(1 for info in src_infos.values() if info is not None and info.digest is None)
+
+        # ── 3. 对比并复制 ────────────────────────────────────────────────────
+        for plan, dst_files in zip(plans, plan_dst_files):
+            item, src_path, dst_path, rules, skipped, normalizer = (
+                plan.item, plan.src_path, plan.dst_path, plan.rules, plan.skipped, plan.normalizer
+            )
+            src_files = {rel: src_infos[p] for rel, p, _ in plan.src_list if src_infos[p] is not None}
+            repo_prefix = dst_path.relative_to(PROJECT_ROOT).as_posix()
+
+            if rules is not None and rules.max_file_size is not None:
+                for rel in [rel for rel, info in src_files.items() if info.size > rules.max_file_size]:
+                    # 超限文件与被排除的文件一样不受管理：既不写入，也不删除目标端已有的副本
+                    skipped.append(
+                        SkippedPath(rel or item, f"over max_file_size {format_bytes(rules.max_file_size)}",
+                                    src_path / rel if rel else src_path)
+                    )
+                    del src_files[rel]
+                    dst_files.pop(rel, None)
+            report_skipped(item_prefix + item, skipped, dry_run)
+            if rules is not None and rules.max_total_size is not None:
+                total = sum(info.size for info in src_files.values())
+                if total > rules.max_total_size:
+                    logger.warning(
+                        f"{item_prefix}{item} is {format_bytes(total)}, over max_total_size "
+                        f"{format_bytes(rules.max_total_size)} — skipping item"
+                    )
+                    continue
+
+            if src_path.is_dir():
+                # 目录：复用扫描得到的逐文件大小/摘要，只同步真正变化的文件
+                changes = diff_dir_files(src_files, dst_files)
+                if normalizer is not None and changes.modified:
+                    modified = drop_semantic_noops(
+                        normalizer, changes.modified, src_path, dst_path, src_files, dst_files,
+                        manifest, tree_files is not None,
+                    )
+                    if len(modified) < len(changes.modified):
+                        noops = set(changes.modified) - set(modified)
+                        logger.info(f"{item_prefix}{item}: {len(noops)} file(s) unchanged after normalization, ignored")
+                        noop_bytes = sum(src_files[rel].size for rel in noops)
+                        changes = changes._replace(
+                            modified=modified,
+                            bytes_to_write=changes.bytes_to_write - noop_bytes,
+                            bytes_skipped=changes.bytes_skipped + noop_bytes,
+                        )
+                if not (changes.added or changes.modified or changes.deleted):
+                    logger.debug(f"Unchanged, skipping: {item_prefix}{item}")
+                    continue
+                if staged is not None:
+                    if _stage_item_changes(item_prefix + item, src_path, repo_prefix, changes, staged, dry_run):
+                        synced.append(item_prefix + item)
+                    continue
+                if sync_dir_incremental(
+                    src_path, dst_path, changes, dry_run=dry_run, executor=pool, manifest=manifest
+                ):
+                    synced.append(item_prefix + item)
+                    if written is not None:
+                        written.extend(
+                            f"{repo_prefix}/{rel}" for rel in changes.added + changes.modified + changes.deleted
+                        )
+                    if not dry_run:
+                        logger.info(
+                            f"Synced: {item_prefix}{item} ({len(changes.added)} added, {len(changes.modified)} modified, "
+                            f"{len(changes.deleted)} deleted, {format_bytes(changes.bytes_to_write)} written)"
+                        )
+                continue
 
-    return synced
+            src_info = src_files.get("")
+            dst_info = dst_files.get("")
+            if src_info is None:
+                if not skipped:
+                    logger.warning(f"Source item is not readable, skipping: {src_path}")
+                continue
+            if src_info == dst_info:
+                logger.debug(f"Unchanged, skipping: {item_prefix}{item}")
+                continue
+            if normalizer is not None and dst_info is not None and not drop_semantic_noops(
+                normalizer, [""], src_path, dst_path, src_files, dst_files, manifest, tree_files is not None
+            ):
+                logger.info(f"{item_prefix}{item}: unchanged after normalization, ignored")
+                continue
 
+            if staged is not None:
+                changes = diff_dir_files(src_files, dst_files)
+                if _stage_item_changes(item_prefix + item, src_path, repo_prefix, changes, staged, dry_run):
+                    synced.append(item_prefix + item)
+                continue
 
-def main() -> int:
-    parser = argparse.ArgumentParser(description="Sync OpenClaw persona files to GitHub")
-    parser.add_argument(
-        "--config",
-        type=Path,
-        default=PROJECT_ROOT / DEFAULT_CONFIG_FILE,
-        help=f"Path to config file (default: {DEFAULT_CONFIG_FILE})",
+            if copy_item(src_path, dst_path, dry_run=dry_run, manifest=manifest):
+                synced.append(item_prefix + item)
+                if written is not None:
+                    written.append(repo_prefix)
+                if not dry_run:
+                    logger.info(f"Synced: {item_prefix}{item}")
+
+    logger.debug(
+        f"Scanned {target_subdir}: {len(src_jobs) + len(dst_paths)} file(s), "
+        f"{n_from_index} from git {'tree' if tree_files is not None else 'index'}, "
+        f"{n_by_size} decided by size"
     )
-    parser.add_argument("--dry-run", action="store_true", help="Show what would change without writing")
-    parser.add_argument("--no-merge", action="store_true", help="Create PR but don't auto-merge")
-    args = parser.parse_args()
+    if owns_manifest:
+        finish_manifest(manifest, workers)
 
-    # ── Load config ───────────────────────────────────────────────────────────
+    return synced
+
+
+def finish_manifest(manifest: HashManifest, workers: int) -> None:
+    """记录哈希清单命中情况并写回磁盘。"""
+    logger.info(
+        f"Hash manifest: {manifest.hits} cached, {manifest.misses} hashed ({workers} worker(s))"
+    )
     try:
-        config = load_config(args.config)
-    except FileNotFoundError as e:
-        print(f"Error: {e}", file=sys.stderr)
+        manifest.save()
+    except OSError as e:
+        logger.warning(f"Failed to save hash manifest (non-fatal): {e}")
+
+
+def sync_jobs(
+    config: dict[str, Any],
+    dry_run: bool = False,
+    workers: int | None = None,
+    base_commit: str | None = None,
+    staged: list[StagedChange] | None = None,
+    manifest: HashManifest | None = None,
+    written: list[str] | None = None,
+) -> list[str]:
+    """
+    并发执行所有同步任务（jobs），共享同一个哈希线程池与哈希清单。
+    返回所有任务中发生变化的项目；多任务时项目名带 <target_subdir>/ 前缀。
+    staged、written 按任务配置顺序合并，保证提交内容与并发调度无关。
+    manifest 由调用方提供时由调用方负责保存。
+    """
+    jobs = get_sync_jobs(config)
+    workers = workers or get_workers(config)
+    owns_manifest = manifest is None
+    if manifest is None:
+        manifest = HashManifest.load(get_log_dir(config) / MANIFEST_FILE)
+    job_staged: list[list[StagedChange] | None] = [
+        [] if staged is not None else None for _ in jobs
+    ]
+    job_written: list[list[str] | None] = [[] if written is not None else None for _ in jobs]
+
+    # 任务线程只负责调度，真正的哈希/复制都提交到共享的 pool，线程总数仍受 workers 约束
+    with ThreadPoolExecutor(max_workers=workers) as pool, ThreadPoolExecutor(
+        max_workers=len(jobs), thread_name_prefix="job"
+    ) as job_pool:
+        futures = [
+            job_pool.submit(
+                sync_items,
+                config,
+                dry_run=dry_run,
+                workers=workers,
+                base_commit=base_commit,
+                staged=job_staged[i],
+                job=job,
+                manifest=manifest,
+                executor=pool,
+                item_prefix=f"{job['target_subdir']}/" if len(jobs) > 1 else "",
+                written=job_written[i],
+            )
+            for i, job in enumerate(jobs)
+        ]
+        results = [future.result() for future in futures]
+
+    if owns_manifest:
+        finish_manifest(manifest, workers)
+    if staged is not None:
+        for changes in job_staged:
+            staged.extend(changes or [])
+    if written is not None:
+        for paths in job_written:
+            written.extend(paths or [])
+    return [item for result in results for item in result]
+
+
+def get_rolling_config(config: dict[str, Any]) -> dict[str, Any] | None:
+    """git.pr_mode 为 rolling 时返回滚动 PR 配置（含默认值），否则返回 None。"""
+    git_cfg = config.get("git", {})
+    if git_cfg.get("pr_mode", "per_run") != "rolling":
+        return None
+    rolling = git_cfg.get("rolling", {})
+    return {
+        "branch": rolling.get("branch", DEFAULT_ROLLING_BRANCH),
+        "merge_after_hours": float(rolling.get("merge_after_hours", DEFAULT_MERGE_AFTER_HOURS)),
+        "merge_after_commits": int(rolling.get("merge_after_commits", DEFAULT_MERGE_AFTER_COMMITS)),
+    }
+
+
+def run_rolling_pr(
+    config: dict[str, Any],
+    args: argparse.Namespace,
+    synced_items: list[str],
+    staged: list[StagedChange],
+    detection_base: str,
+    manifest: HashManifest | None = None,
+    source_digest: str | None = None,
+) -> int:
+    """
+    滚动 PR：所有运行的提交追加到同一个长期同步分支，并更新同一个未合并 PR；
+    分支上的提交数或最早一次提交的时长达到阈值时才合并（见 merge_rolling_pr_if_due）。
+    source_digest 为扫描前取得的源端 stat 摘要，仅在未产生新提交时用于保存预检快照。
+    """
+    git_cfg = config.get("git", {})
+    rolling = get_rolling_config(config) or {}
+    branch = rolling["branch"]
+    default_branch = git_cfg.get("default_branch", "main")
+    commit_prefix = git_cfg.get("commit_prefix", "[sync]")
+    pr_title = git_cfg.get("pr_title_template", "Sync: Update persona files from workspace")
+
+    base_commit = resolve_base_commit(PROJECT_ROOT, default_branch, fetch=True)
+    pr = find_open_pr(PROJECT_ROOT, branch)
+    tip = resolve_remote_branch(PROJECT_ROOT, branch) if pr else None
+    parent = tip or base_commit
+
+    if parent != detection_base:
+        # 对比基准已过期（例如滚动 PR 已被人工关闭）：以新的父提交重新计算变更
+        staged = []
+        synced_items = sync_jobs(
+            config, workers=args.workers, base_commit=parent, staged=staged, manifest=manifest
+        )
+        if not synced_items:
+            logger.info(f"No changes relative to {branch if tip else 'origin/' + default_branch}.")
+            return merge_rolling_pr_if_due(config, args, base_commit, source_digest)
+
+    commit_msg = (
+        f"{commit_prefix} Update persona files from workspace "
+        f"({datetime.now().strftime('%Y-%m-%d %H:%M')})"
+    )
+    commit = commit_with_private_index(
+        PROJECT_ROOT,
+        parent,
+        staged,
+        build_commit_message(commit_msg, synced_items),
+        get_log_dir(config) / "openclaw_sync.index",
+        manifest,
+    )
+    if commit is None:
+        logger.info("No diff against the rolling branch — already up to date.")
+        return merge_rolling_pr_if_due(config, args, base_commit, source_digest)
+
+    # 分支重新开始（无未合并 PR）时强制覆盖远端上可能残留的旧分支
+    force = "" if tip else "+"
+    with METRICS.phase("push"):
+        run_git(["push", "origin", f"{force}{commit}:refs/heads/{branch}"], cwd=PROJECT_ROOT)
+    run_git(["update-ref", f"refs/remotes/origin/{branch}", commit], cwd=PROJECT_ROOT)
+    logger.info(f"Pushed {commit[:12]} to rolling branch: {branch}")
+
+    # PR 正文列出相对默认分支累计变化的全部文件
+    changed = run_git(
+        ["diff", "--name-only", f"{base_commit}...{commit}"], cwd=PROJECT_ROOT
+    ).stdout.split()
+    pr_body = format_pr_body(config, changed)
+    if pr:
+        update_pr_body(PROJECT_ROOT, pr["number"], pr_body)
+    else:
+        create_pr(PROJECT_ROOT, branch, pr_title, pr_body, default_branch)
+
+    # 本次运行产生了新提交：预检快照留给之后扫描确认无变更的运行记录
+    return merge_rolling_pr_if_due(config, args, base_commit, None)
+
+
+def merge_rolling_pr_if_due(
+    config: dict[str, Any],
+    args: argparse.Namespace,
+    base_commit: str,
+    source_digest: str | None,
+) -> int:
+    """
+    检查未合并的滚动 PR，达到提交数或时长阈值时合并。没有新变更的运行也会调用，
+    因此 PR 在没有后续编辑时仍按节奏合并。
+
+    PR 仍在等待合并时作废预检快照，之后的 --precheck 运行会走完整流程来检查阈值；
+    没有未合并 PR（或刚刚合并）时才用 source_digest 保存快照。
+    """
+    git_cfg = config.get("git", {})
+    rolling = get_rolling_config(config) or {}
+    branch = rolling["branch"]
+    pr_title = git_cfg.get("pr_title_template", "Sync: Update persona files from workspace")
+
+    pr = find_open_pr(PROJECT_ROOT, branch)
+    tip = resolve_remote_branch(PROJECT_ROOT, branch) if pr else None
+    if not pr or not tip:
+        # PR 已被人工合并或关闭：清掉跟踪引用，之后无变更的运行不必再查询 PR
+        run_git(["update-ref", "-d", f"refs/remotes/origin/{branch}"], cwd=PROJECT_ROOT, check=False)
+        save_precheck_snapshot(args.config, config, source_digest)
+        return 0
+    pr_url = pr["url"]
+
+    changed = run_git(
+        ["diff", "--name-only", f"{base_commit}...{tip}"], cwd=PROJECT_ROOT
+    ).stdout.split()
+    n_commits = int(
+        run_git(["rev-list", "--count", f"{base_commit}..{tip}"], cwd=PROJECT_ROOT).stdout.strip()
+    )
+    first_ts = run_git(
+        ["log", "--reverse", "--format=%ct", f"{base_commit}..{tip}"], cwd=PROJECT_ROOT
+    ).stdout.split()
+    age_hours = (time.time() - int(first_ts[0])) / 3600 if first_ts else 0.0
+    logger.info(
+        f"Rolling PR {pr_url}: {n_commits} commit(s), {len(changed)} file(s), oldest {age_hours:.1f}h"
+    )
+
+    due = n_commits >= rolling["merge_after_commits"] or age_hours >= rolling["merge_after_hours"]
+    if args.no_merge or not due:
+        logger.info("Rolling PR left open (merge threshold not reached or --no-merge).")
+        PRECHECK_FILE.unlink(missing_ok=True)
+        return 0
+
+    if not merge_pr(PROJECT_ROOT, branch):
+        notify_telegram(
+            config,
+            f"⚠️ <b>OpenClaw Sync — Manual Merge Required</b>\n\n"
+            f"Rolling PR auto-merge failed.\n"
+            f"<b>PR:</b> {pr_url}",
+        )
+        PRECHECK_FILE.unlink(missing_ok=True)
         return 1
 
-    # ── Logging ───────────────────────────────────────────────────────────────
-    log_cfg = config.get("logging", {})
-    log_dir = PROJECT_ROOT / log_cfg.get("log_dir", "logs")
-    setup_logging(
-        log_dir=log_dir,
-        level=log_cfg.get("level", "INFO"),
-        console_output=log_cfg.get("console_output", True),
+    run_git(["update-ref", "-d", f"refs/remotes/origin/{branch}"], cwd=PROJECT_ROOT, check=False)
+    resolve_base_commit(PROJECT_ROOT, git_cfg.get("default_branch", "main"), fetch=True)
+    save_precheck_snapshot(args.config, config, source_digest)
+    items_text = "\n".join(f"  • {p}" for p in changed)
+    notify_telegram(
+        config,
+        f"✅ <b>OpenClaw Sync — Rolling PR Merged</b>\n\n"
+        f"<b>Repository:</b> everything_openclaw\n"
+        f"<b>PR:</b> <a href=\"{pr_url}\">{pr_title}</a> ({n_commits} commit(s))\n\n"
+        f"<b>Synced files ({len(changed)}):</b>\n{items_text}",
     )
+    return 0
 
 
-    logger.info("=" * 60)
-    logger.info("OpenClaw Sync started")
-    logger.info(f"Config : {args.config}")
-    logger.info(f"Dry run: {args.dry_run}")
-    logger.info("=" * 60)
+def run_sync(config: dict[str, Any], args: argparse.Namespace) -> int:
+    """执行一次完整的同步流程并记录本次运行指标（dry-run 不写入历史），返回退出码。"""
+    METRICS.reset()
+    manifest = HashManifest.load(get_log_dir(config) / MANIFEST_FILE)
+    code = 1
+    try:
+        code = _run_sync(config, args, manifest)
+    finally:
+        finish_manifest(manifest, args.workers or get_workers(config))
+        changed = METRICS.counters["items_synced"] > 0
+        record = METRICS.record("error" if code else "changed" if changed else "unchanged")
+        log_run_metrics(record)
+        if not args.dry_run:
+            write_run_metrics(config, record)
+        flush_notifications(config)
+    return code
+
+
+def run_exclusive(config: dict[str, Any], args: argparse.Namespace) -> int:
+    """
+    持锁执行 run_sync。已有实例在运行时登记重跑请求并立即返回 0；
+    持锁实例每轮结束后检查重跑标记，有请求就再跑一轮。
+    """
+    lock = RunLock(get_log_dir(config))
+    if not lock.acquire():
+        lock.request_rerun()
+        # 登记之后再试一次：对方可能恰好在登记前释放了锁、已经检查过标记
+        if not lock.acquire():
+            logger.info(f"Another sync run is in progress (pid {lock.holder()}); rerun requested. Exiting.")
+            return 0
+        logger.info("Previous sync run just finished; running now.")
+
+    while True:
+        # 本轮同步覆盖此前的所有重跑请求
+        lock.take_rerun_request()
+        code = run_sync(config, args)
+        # 先释放再检查标记：释放前登记的请求一定能被看到，释放后登记的实例能拿到锁自己运行
+        lock.release()
+        if not lock.rerun_flag.exists() or not lock.acquire():
+            return code
+        logger.info("Rerun requested during the last run — syncing again.")
+
+
+def _run_sync(config: dict[str, Any], args: argparse.Namespace, manifest: HashManifest) -> int:
+    """执行一次完整的 同步 → 提交 → PR → 合并 → 通知 流程，返回退出码。"""
+    git_cfg = config.get("git", {})
+    default_branch = git_cfg.get("default_branch", "main")
+    rolling = get_rolling_config(config)
+    # rolling 模式的提交总是追加到远端同步分支上，因此固定使用 private_index 方式构造
+    private_index = rolling is not None or git_cfg.get("commit_mode", "checkout") == "private_index"
+
+    # ── Resume an interrupted run ─────────────────────────────────────────────
+    # rolling 模式每次都从远端分支与未合并 PR 重建状态，本身即可重入，不使用日志
+    journal = SyncJournal.load(get_log_dir(config) / JOURNAL_FILE)
+    pending_items: list[str] = []
+    pending_written: list[str] | None = []
+    # 自动合并失败、PR 仍打开时为 True：本次的新变更追加到该 PR 的分支上
+    stalled = False
+    if journal.stage and rolling is None:
+        if args.dry_run:
+            logger.info(f"[DRY RUN] Would resume interrupted sync after stage '{journal.stage}'.")
+        elif journal.reached("committed"):
+            logger.info(
+                f"Resuming interrupted sync after stage '{journal.stage}' "
+                f"(branch {journal.state.get('branch')}, started {journal.state.get('started')})"
+            )
+            code = finish_branch_pr(config, args, journal)
+            if journal.stage == "pr_opened" and journal.state.get("merge_attempts"):
+                # 不开新分支（同一批变更会出现两个 PR），但仍要检测新变更，否则同步会一直停在这里
+                stalled = True
+                private_index = journal.state.get("private_index", False)
+                pending_items = journal.state.get("stacked_items", [])
+                pending_written = journal.state.get("stacked_written")
+                if private_index:
+                    pending_items = []
+                else:
+                    try:
+                        checkout_pending_branch(journal.state["branch"])
+                    except subprocess.CalledProcessError as e:
+                        logger.error(f"Cannot check out pending sync branch: {e.stderr or e}")
+                        return 1
+            elif code or journal.stage:
+                return code
+        elif journal.stage == "copied":
+            # checkout 模式已复制进工作区但未提交：这些文件与源一致，不会再被检测为变更
+            pending_items = journal.state.get("synced_items", [])
+            # 旧版日志未记录写入路径时退回到提交整个工作区
+            pending_written = journal.state.get("written")
+            logger.info(f"Resuming: {len(pending_items)} item(s) copied by an interrupted run are not yet committed")
+        else:
+            # private_index 模式只写入了 blob，重新检测即可（哈希清单使其很快）
+            journal.clear()
 
     # ── Sync files ────────────────────────────────────────────────────────────
-    synced_items = sync_items(config, dry_run=args.dry_run)
+    staged: list[StagedChange] | None = None
+    base_commit: str | None = None
+    rolling_tip = ""
+    if stalled and private_index:
+        # 与待合并分支比较，已在 PR 中的变更不会被重复提交
+        base_commit = journal.state["commit"]
+        staged = []
+    elif private_index:
+        # 与远端跟踪分支的树比较；真正构造提交前会再 fetch 一次拿到最新 base
+        try:
+            base_commit = resolve_base_commit(PROJECT_ROOT, default_branch)
+            if rolling is not None:
+                # 与滚动分支比较，已在分支上的变更不会被重复提交
+                rolling_tip = run_git(
+                    ["rev-parse", "--verify", "--quiet", f"refs/remotes/origin/{rolling['branch']}"],
+                    cwd=PROJECT_ROOT,
+                    check=False,
+                ).stdout.strip()
+                base_commit = rolling_tip or base_commit
+        except (OSError, subprocess.CalledProcessError) as e:
+            logger.error(f"Cannot resolve origin/{default_branch}: {getattr(e, 'stderr', None) or e}")
+            return 1
+        staged = []
+    # checkout 模式记录写入工作区的路径，提交时只暂存这些路径
+    written: list[str] | None = None if private_index else []
+    # 预检快照的源端摘要在扫描之前取得：之后的编辑都会让下一次预检走完整流程
+    source_digest = None if args.dry_run else compute_stat_digest(get_precheck_jobs(config))
+    synced_items = sync_jobs(
+        config,
+        dry_run=args.dry_run,
+        workers=args.workers,
+        base_commit=base_commit,
+        staged=staged,
+        manifest=manifest,
+        written=written,
+    )
+    synced_items = list(dict.fromkeys(pending_items + synced_items))
+    if written is not None:
+        written = None if pending_written is None else list(dict.fromkeys(pending_written + written))
+    METRICS.add(items_synced=len(synced_items))
+
+    if stalled:
+        return stack_on_pending_pr(config, journal, synced_items, staged or [], written, manifest)
 
     if not synced_items:
-        logger.info("No changes detected — nothing to sync. Exiting.")
+        logger.info("No changes detected — nothing to sync.")
+        if args.dry_run:
+            return 0
+        journal.clear()
+        if rolling_tip:
+            # 滚动分支上还有未合并的提交：没有新变更也要按节奏检查并合并
+            try:
+                return merge_rolling_pr_if_due(
+                    config, args, resolve_base_commit(PROJECT_ROOT, default_branch, fetch=True), source_digest
+                )
+            except subprocess.CalledProcessError as e:
+                logger.error(f"Git/GitHub operation failed: {e.stderr or e}")
+                return 1
+        save_precheck_snapshot(args.config, config, source_digest)
         return 0
 
     logger.info(f"Synced {len(synced_items)} item(s): {', '.join(synced_items)}")
@@ -364,84 +3084,273 @@ def main() -> int:
         return 0
 
     # ── Git / GitHub operations ───────────────────────────────────────────────
-    git_cfg = config.get("git", {})
-    default_branch  = git_cfg.get("default_branch", "main")
-    commit_prefix   = git_cfg.get("commit_prefix", "[sync]")
-    pr_title        = git_cfg.get("pr_title_template", "Sync: Update persona files from workspace")
-    pr_body_tpl     = git_cfg.get(
-        "pr_body_template",
-        "Automated sync of persona files from Raspberry Pi workspace.\n\nSynced items:\n{synced_items}\n\n---\n*Created automatically by openclaw_sync.py*",
+    if rolling is not None:
+        try:
+            return run_rolling_pr(
+                config, args, synced_items, staged or [], base_commit or "", manifest, source_digest
+            )
+        except subprocess.CalledProcessError as e:
+            logger.error(f"Git/GitHub operation failed: {e.stderr or e}")
+            return 1
+        except Exception as e:
+            logger.error(f"Unexpected error: {e}")
+            return 1
+
+    journal.advance(
+        "hashed" if private_index else "copied",
+        synced_items=synced_items,
+        private_index=private_index,
+        written=written,
     )
-
+    commit_prefix = git_cfg.get("commit_prefix", "[sync]")
     branch_name: str | None = None
-    pr_url: str | None = None
-    merged = False
 
     try:
         run_git(["rev-parse", "--git-dir"], cwd=PROJECT_ROOT)  # sanity check
 
-        branch_name = create_sync_branch(PROJECT_ROOT, default_branch)
-
         commit_msg = (
             f"{commit_prefix} Update persona files from workspace "
             f"({datetime.now().strftime('%Y-%m-%d %H:%M')})"
         )
 
-        if not commit_changes(PROJECT_ROOT, commit_msg, synced_items):
-            # Files were copied but git sees no diff (e.g. identical content)
-            logger.info("No git diff after copy — already up to date.")
-            cleanup_local_branch(PROJECT_ROOT, branch_name, default_branch)
-            return 0
+        if private_index:
+            # 不切换主工作区分支：在临时索引上构造提交，再直接指向同步分支
+            base_commit = resolve_base_commit(PROJECT_ROOT, default_branch, fetch=True)
+            commit = commit_with_private_index(
+                PROJECT_ROOT,
+                base_commit,
+                staged or [],
+                build_commit_message(commit_msg, synced_items),
+                get_log_dir(config) / "openclaw_sync.index",
+                manifest,
+            )
+            if commit is None:
+                logger.info(f"No diff against origin/{default_branch} — already up to date.")
+                journal.clear()
+                save_precheck_snapshot(args.config, config, source_digest)
+                return 0
+            branch_name = make_sync_branch_name()
+            run_git(["update-ref", f"refs/heads/{branch_name}", commit, ""], cwd=PROJECT_ROOT)
+            logger.info(f"Created branch: {branch_name}")
+        else:
+            if git_cfg.get("accelerate_status", True):
+                enable_status_acceleration(PROJECT_ROOT)
+            branch_name = create_sync_branch(PROJECT_ROOT, default_branch)
+
+            if not commit_changes(PROJECT_ROOT, commit_msg, synced_items, written):
+                # Files were copied but git sees no diff (e.g. identical content)
+                logger.info("No git diff after copy — already up to date.")
+                cleanup_local_branch(PROJECT_ROOT, branch_name, default_branch)
+                journal.clear()
+                save_precheck_snapshot(args.config, config, source_digest)
+                return 0
+            commit = run_git(["rev-parse", "HEAD"], cwd=PROJECT_ROOT).stdout.strip()
+
+        journal.advance("committed", branch=branch_name, commit=commit)
+    except subprocess.CalledProcessError as e:
+        logger.error(f"Git/GitHub operation failed: {e.stderr or e}")
+        abort_branch(branch_name, default_branch, private_index)
+        return 1
+    except Exception as e:
+        logger.error(f"Unexpected error: {e}")
+        abort_branch(branch_name, default_branch, private_index)
+        return 1
 
-        push_branch(PROJECT_ROOT, branch_name)
+    return finish_branch_pr(config, args, journal)
 
-        pr_body = pr_body_tpl.format(
-            synced_items="\n".join(f"- `{i}`" for i in synced_items)
-        )
-        pr_url = create_pr(PROJECT_ROOT, branch_name, pr_title, pr_body, default_branch)
 
-        if args.no_merge:
-            logger.info(f"PR created (auto-merge skipped): {pr_url}")
+def abort_branch(branch_name: str | None, default_branch: str, private_index: bool) -> None:
+    """提交未完成时放弃本地同步分支（checkout 模式同时切回默认分支）。"""
+    if not branch_name:
+        return
+    if private_index:
+        delete_local_branch_ref(PROJECT_ROOT, branch_name)
+    else:
+        cleanup_local_branch(PROJECT_ROOT, branch_name, default_branch)
+
+
+def checkout_pending_branch(branch_name: str) -> None:
+    """checkout 模式：确保主工作区位于待合并的同步分支上，新变更与它比较并提交在它之上。"""
+    head = run_git(["symbolic-ref", "--quiet", "--short", "HEAD"], cwd=PROJECT_ROOT, check=False).stdout.strip()
+    if head != branch_name:
+        run_git(["checkout", branch_name], cwd=PROJECT_ROOT)
+        logger.info(f"Checked out pending sync branch: {branch_name}")
+
+
+def stack_on_pending_pr(
+    config: dict[str, Any],
+    journal: SyncJournal,
+    synced_items: list[str],
+    staged: list[StagedChange],
+    written: list[str] | None,
+    manifest: HashManifest | None = None,
+) -> int:
+    """
+    自动合并失败、PR 仍打开时，把本次检测到的变更作为新提交追加到 PR 的分支并推送，
+    PR 随之更新，之后的运行继续重试合并。PR 未合并前总是返回 1，运行记为 error。
+    """
+    git_cfg = config.get("git", {})
+    state = journal.state
+    branch_name: str = state["branch"]
+    pr_url = state.get("pr_url", "")
+    if not synced_items:
+        logger.warning(f"No new changes; sync is blocked until the PR is merged: {pr_url}")
+        return 1
+
+    commit_msg = (
+        f"{git_cfg.get('commit_prefix', '[sync]')} Update persona files from workspace "
+        f"({datetime.now().strftime('%Y-%m-%d %H:%M')})"
+    )
+    all_items = list(dict.fromkeys(state.get("synced_items", []) + synced_items))
+    try:
+        if state.get("private_index"):
+            commit = commit_with_private_index(
+                PROJECT_ROOT,
+                state["commit"],
+                staged,
+                build_commit_message(commit_msg, synced_items),
+                get_log_dir(config) / "openclaw_sync.index",
+                manifest,
+            )
+            if commit is None:
+                logger.info("No diff against the pending sync branch — already up to date.")
+                return 1
+            run_git(["update-ref", f"refs/heads/{branch_name}", commit, state["commit"]], cwd=PROJECT_ROOT)
         else:
-            import time
-            time.sleep(2)  # brief wait for GitHub to register the PR
-            merged = merge_pr(PROJECT_ROOT, branch_name)
+            # 已复制进工作区但尚未提交的变更记入日志，提交前中断时下次运行仍会带上它们
+            journal.advance("pr_opened", stacked_items=synced_items, stacked_written=written)
+            if not commit_changes(PROJECT_ROOT, commit_msg, synced_items, written):
+                logger.info("No git diff after copy — already up to date.")
+                journal.advance("pr_opened", stacked_items=[], stacked_written=[])
+                return 1
+            commit = run_git(["rev-parse", "HEAD"], cwd=PROJECT_ROOT).stdout.strip()
+
+        # 回到 committed：推送中断时下次运行先推送、复用同一个 PR，再重试合并
+        journal.advance("committed", commit=commit, synced_items=all_items, stacked_items=[], stacked_written=[])
+        push_branch(PROJECT_ROOT, branch_name)
+        journal.advance("pushed")
+        pr = find_open_pr(PROJECT_ROOT, branch_name)
+        if pr:
+            update_pr_body(PROJECT_ROOT, pr["number"], format_pr_body(config, all_items))
+        journal.advance("pr_opened")
+    except subprocess.CalledProcessError as e:
+        logger.error(f"Git/GitHub operation failed: {e.stderr or e}")
+        logger.info(f"Sync state kept at stage '{journal.stage}'; the next run resumes from there.")
+        return 1
+
+    logger.info(f"Added {len(synced_items)} item(s) to the pending PR, still waiting for merge: {pr_url}")
+    return 1
 
-            if merged:
-                logger.info("Sync completed and PR merged successfully.")
-                # Pull merged changes back
-                run_git(["checkout", default_branch], cwd=PROJECT_ROOT)
-                run_git(["pull", "origin", default_branch], cwd=PROJECT_ROOT)
 
-                # ── Telegram notification ─────────────────────────────────────
-                items_text = "\n".join(f"  • {i}" for i in synced_items)
-                tg_msg = (
-                    f"✅ <b>OpenClaw Sync — PR Merged</b>\n\n"
-                    f"<b>Repository:</b> everything_openclaw\n"
-                    f"<b>PR:</b> <a href=\"{pr_url}\">{pr_title}</a>\n\n"
-                    f"<b>Synced files ({len(synced_items)}):</b>\n{items_text}"
+def finish_branch_pr(config: dict[str, Any], args: argparse.Namespace, journal: SyncJournal) -> int:
+    """
+    从日志记录的最后一步继续：推送 → 开 PR → 合并 → 拉回 → 通知，每步完成即写入日志。
+
+    失败时保留分支与日志，下次运行重试失败的那一步；自动合并失败时 PR 保持打开，
+    之后每次运行先检查它是否已被人工合并或关闭，再重试合并。合并失败的运行都返回 1
+    并发送告警（与滚动 PR 一致），PR 不会在无人察觉的情况下一直搁置。
+    """
+    git_cfg = config.get("git", {})
+    default_branch = git_cfg.get("default_branch", "main")
+    pr_title        = git_cfg.get("pr_title_template", "Sync: Update persona files from workspace")
+    state = journal.state
+    branch_name: str = state["branch"]
+    synced_items: list[str] = state.get("synced_items", [])
+    private_index: bool = state.get("private_index", False)
+
+    try:
+        if not journal.reached("pushed"):
+            if run_git(
+                ["rev-parse", "--verify", "--quiet", f"refs/heads/{branch_name}"], cwd=PROJECT_ROOT, check=False
+            ).returncode != 0:
+                logger.warning(f"Local branch {branch_name} no longer exists — discarding interrupted sync.")
+                journal.clear()
+                return 0
+            push_branch(PROJECT_ROOT, branch_name)
+            journal.advance("pushed")
+
+        if not journal.reached("pr_opened"):
+            # 上次可能在 gh 返回后、写日志前中断：先查已有 PR，避免重复创建
+            pr = find_open_pr(PROJECT_ROOT, branch_name)
+            if pr:
+                pr_url = pr["url"]
+                logger.info(f"Reusing open PR: {pr_url}")
+            else:
+                pr_url = create_pr(
+                    PROJECT_ROOT, branch_name, pr_title, format_pr_body(config, synced_items), default_branch
                 )
-                notify_telegram(config, tg_msg)
+            journal.advance("pr_opened", pr_url=pr_url)
+        pr_url = state["pr_url"]
+
+        if not journal.reached("merged"):
+            if args.no_merge:
+                logger.info(f"PR created (auto-merge skipped): {pr_url}")
+                journal.clear()
+                return 0
+
+            merge_attempts = state.get("merge_attempts", 0)
+            if merge_attempts:
+                pr_state = get_pr_state(PROJECT_ROOT, branch_name)
+                if pr_state == "CLOSED":
+                    logger.warning(f"PR was closed without merging — discarding interrupted sync: {pr_url}")
+                    abort_branch(branch_name, default_branch, private_index)
+                    journal.clear()
+                    return 0
+                merged = pr_state == "MERGED" or merge_pr(PROJECT_ROOT, branch_name)
             else:
-                logger.warning(f"PR created but auto-merge failed: {pr_url}")
-                logger.warning("Please merge manually.")
-                # Still notify — merge needs manual action
+                time.sleep(2)  # brief wait for GitHub to register the PR
+                merged = merge_pr(PROJECT_ROOT, branch_name)
+
+            if not merged:
+                journal.advance("pr_opened", merge_attempts=merge_attempts + 1)
+                logger.warning(f"PR auto-merge failed (attempt {merge_attempts + 1}): {pr_url}")
+                logger.warning("Please merge manually; the next run will retry the merge.")
+                # 每次失败都通知：PR 未合并期间新变更只能追加到它的分支上，需要人工处理
                 notify_telegram(
                     config,
                     f"⚠️ <b>OpenClaw Sync — Manual Merge Required</b>\n\n"
-                    f"PR created but auto-merge failed.\n"
+                    f"PR auto-merge failed ({merge_attempts + 1} attempt(s)).\n"
                     f"<b>PR:</b> {pr_url}",
                 )
+                # 作废预检快照，之后的 --precheck 运行也会重试合并
+                PRECHECK_FILE.unlink(missing_ok=True)
+                return 1
+            journal.advance("merged")
+
+        if not journal.reached("notified"):
+            logger.info("Sync completed and PR merged successfully.")
+            if private_index:
+                # 只更新远端跟踪分支供下次比较，主工作区保持原样
+                resolve_base_commit(PROJECT_ROOT, default_branch, fetch=True)
+                delete_local_branch_ref(PROJECT_ROOT, branch_name)
+            else:
+                # Pull merged changes back
+                run_git(["checkout", default_branch], cwd=PROJECT_ROOT)
+                run_git(["pull", "origin", default_branch], cwd=PROJECT_ROOT)
+                run_git(["branch", "-D", branch_name], cwd=PROJECT_ROOT, check=False)
+            # 不在此保存预检快照：推送、合并、拉回期间源目录可能又有编辑，
+            # 留给下一次扫描确认无变更的运行记录
+
+            # ── Telegram notification ─────────────────────────────────────────
+            items_text = "\n".join(f"  • {i}" for i in synced_items)
+            tg_msg = (
+                f"✅ <b>OpenClaw Sync — PR Merged</b>\n\n"
+                f"<b>Repository:</b> everything_openclaw\n"
+                f"<b>PR:</b> <a href=\"{pr_url}\">{pr_title}</a>\n\n"
+                f"<b>Synced files ({len(synced_items)}):</b>\n{items_text}"
+            )
+            # 消息进入持久化 outbox 即视为完成，送达由后台线程与之后的运行负责
+            notify_telegram(config, tg_msg)
+            journal.advance("notified")
+        journal.clear()
 
     except subprocess.CalledProcessError as e:
         logger.error(f"Git/GitHub operation failed: {e.stderr or e}")
-        if branch_name:
-            cleanup_local_branch(PROJECT_ROOT, branch_name, default_branch)
+        logger.info(f"Sync state kept at stage '{journal.stage}'; the next run resumes from there.")
         return 1
     except Exception as e:
         logger.error(f"Unexpected error: {e}")
-        if branch_name:
-            cleanup_local_branch(PROJECT_ROOT, branch_name, default_branch)
+        logger.info(f"Sync state kept at stage '{journal.stage}'; the next run resumes from there.")
         return 1
 
     logger.info("=" * 60)
@@ -450,5 +3359,88 @@ def main() -> int:
     return 0
 
 
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Sync OpenClaw persona files to GitHub")
+    parser.add_argument(
+        "--config",
+        type=Path,
+        default=PROJECT_ROOT / DEFAULT_CONFIG_FILE,
+        help=f"Path to config file (default: {DEFAULT_CONFIG_FILE})",
+    )
+    parser.add_argument("--dry-run", action="store_true", help="Show what would change without writing")
+    parser.add_argument("--no-merge", action="store_true", help="Create PR but don't auto-merge")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help=f"Hash/copy thread pool size (default: performance.workers or {DEFAULT_WORKERS})",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Run continuously, syncing after inotify events settle (Linux only)",
+    )
+    parser.add_argument(
+        "--debounce",
+        type=float,
+        default=None,
+        help=f"Watch mode: seconds of quiet before a batch is synced (default: watch.debounce_seconds or {DEFAULT_DEBOUNCE_SECONDS})",
+    )
+    parser.add_argument(
+        "--precheck",
+        action="store_true",
+        help="Exit immediately if a stat-only scan matches the last successful run",
+    )
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="Summarise run history (p50/p95 run time, bytes per run, weekly trend) and exit",
+    )
+    args = parser.parse_args()
+
+    # ── Fast path: stat-only pre-check, before any heavy import ──────────────
+    if args.precheck and not args.dry_run and not args.watch and precheck_unchanged(args.config):
+        print(
+            f"{datetime.now():%Y-%m-%d %H:%M:%S} | INFO     | "
+            f"OpenClaw Sync: no changes (stat pre-check, {elapsed_ms():.1f} ms). Exiting."
+        )
+        return 0
+
+    # ── Load config ───────────────────────────────────────────────────────────
+    try:
+        config = load_config(args.config)
+        get_sync_jobs(config)  # 提前校验 jobs 配置
+    except (FileNotFoundError, KeyError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+    configure_commands(config)
+
+    if args.stats:
+        return print_stats(config)
+
+    # ── Logging ───────────────────────────────────────────────────────────────
+    log_cfg = config.get("logging", {})
+    setup_logging(
+        log_dir=get_log_dir(config),
+        level=log_cfg.get("level", "INFO"),
+        console_output=log_cfg.get("console_output", True),
+    )
+
+    logger.info("=" * 60)
+    logger.info("OpenClaw Sync started" + (" (watch mode)" if args.watch else ""))
+    logger.info(f"Config : {args.config}")
+    logger.info(f"Dry run: {args.dry_run}")
+    logger.info(f"Startup: {elapsed_ms():.1f} ms (imports, config, logging)")
+    logger.info("=" * 60)
+
+    try:
+        if args.watch:
+            return watch_sync(config, args)
+        return run_exclusive(config, args)
+    finally:
+        close_notifications()
+
+
 if __name__ == "__main__":
     sys.exit(main())
@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+"""
+OpenClaw Sync Benchmark
+
+两种模式：
+
+1. 哈希吞吐量（默认）：在合成 workspace 上测量目录哈希吞吐量，
+   对比不同线程池大小（默认 1/2/4）的表现，并校验目录摘要与线程数无关。
+
+2. 场景套件（--suite）：为每种合成 workspace（少量/大量 markdown、大二进制文件、
+   只追加的日志文件）建立本地 bare 远端与克隆，分别在 无变化 / 单文件变化 / 多文件变化
+   三种场景下计时 calculate_dir_hash、sync_items、提交并推送（checkout 模式）
+   以及 private_index 提交。结果写入 JSON，与基线比较，任一指标超出回归阈值即以 1 退出。
+
+Usage:
+    python scripts/openclaw_sync_bench.py [--files N] [--size BYTES] [--workers 1,2,4] [--repeat R]
+    python scripts/openclaw_sync_bench.py --suite [--profiles md-10,md-1k,binary,journals]
+        [--repeat R] [--baseline PATH] [--threshold 0.25] [--update-baseline] [--output PATH]
+
+合成 workspace 创建在临时目录中，测量结束后自动删除。
+哈希吞吐量模式每轮均不使用哈希清单（冷哈希），文件内容由页缓存提供。
+基线与机器相关，默认保存在 logs/openclaw_sync_bench_baseline.json（不纳入版本库）。
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable
+
+sys.path.insert(0, str(Path(__file__).parent.resolve()))
+
+import openclaw_sync  # noqa: E402
+
+DEFAULT_BASELINE = openclaw_sync.PROJECT_ROOT / "logs" / "openclaw_sync_bench_baseline.json"
+DEFAULT_THRESHOLD = 0.25
+# 低于此绝对差值（秒）的变化视为噪声，不判定为回归
+NOISE_FLOOR_SECONDS = 0.005
+
+# 合成 workspace 规格：文件数、单文件大小、内容类型
+PROFILES: dict[str, dict[str, Any]] = {
+    "md-10": {"files": 10, "size": 2 * 1024, "kind": "markdown"},
+    "md-1k": {"files": 1_000, "size": 2 * 1024, "kind": "markdown"},
+    "md-10k": {"files": 10_000, "size": 2 * 1024, "kind": "markdown"},
+    "md-100k": {"files": 100_000, "size": 1024, "kind": "markdown"},
+    "binary": {"files": 20, "size": 8 * 1024 * 1024, "kind": "binary"},
+    "journals": {"files": 200, "size": 64 * 1024, "kind": "journal"},
+}
+DEFAULT_PROFILES = "md-10,md-1k,binary,journals"
+SCENARIOS = ("no-change", "one-file", "many-files")
+METRICS = ("hash_dir", "sync_items", "commit_push", "private_index")
+# many-files 场景修改的文件比例
+MANY_FILES_FRACTION = 0.1
+
+
+def make_workspace(root: Path, n_files: int, file_size: int) -> int:
+    """生成 memory/ 风格的合成目录：每个子目录 100 个文件。返回总字节数。"""
+    block = os.urandom(min(file_size, 1024 * 1024))
+    total = 0
+    for i in range(n_files):
+        sub = root / "memory" / f"d{i // 100:03d}"
+        sub.mkdir(parents=True, exist_ok=True)
+        data = (block * (file_size // len(block) + 1))[:file_size]
+        # 每个文件前缀不同，避免内容完全重复
+        (sub / f"2026-01-01-{i:05d}.md").write_bytes(f"{i}\n".encode() + data)
+        total += file_size + len(f"{i}\n")
+    return total
+
+
+def bench_dir_hash(dirpath: Path, workers: int, repeat: int) -> tuple[float, str]:
+    """返回 (最快一轮耗时秒数, 目录摘要)。"""
+    best = float("inf")
+    digest = ""
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            digest = openclaw_sync.calculate_dir_hash(dirpath, executor=pool)
+        best = min(best, time.perf_counter() - t0)
+    return best, digest
+
+
+def run_hash_throughput(args: argparse.Namespace) -> int:
+    worker_counts = [int(w) for w in args.workers.split(",") if w.strip()]
+
+    with tempfile.TemporaryDirectory(prefix="openclaw_bench_") as tmp:
+        root = Path(tmp)
+        total = make_workspace(root, args.files, args.size)
+        print(f"Synthetic workspace: {args.files} files, {openclaw_sync.format_bytes(total)}")
+        print(f"{'workers':>8} | {'time (s)':>9} | {'MiB/s':>8} | speedup")
+
+        baseline: float | None = None
+        digests: set[str] = set()
+        for workers in worker_counts:
+            elapsed, digest = bench_dir_hash(root / "memory", workers, args.repeat)
+            digests.add(digest)
+            baseline = baseline or elapsed
+            mib_s = total / elapsed / (1024 * 1024)
+            print(f"{workers:>8} | {elapsed:>9.3f} | {mib_s:>8.1f} | {baseline / elapsed:.2f}x")
+
+    if len(digests) != 1:
+        print("ERROR: directory digest differs between worker counts", file=sys.stderr)
+        return 1
+    print("Directory digest identical across worker counts.")
+    return 0
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Scenario Suite
+# ─────────────────────────────────────────────────────────────────────────────
+
+def make_profile_workspace(root: Path, profile: dict[str, Any]) -> list[Path]:
+    """按 profile 生成 root/memory 下的文件，返回文件列表；mtime 统一设为两小时前。"""
+    kind, size = profile["kind"], profile["size"]
+    block = os.urandom(min(size, 1024 * 1024)) if kind == "binary" else (
+        "- 今天和用户讨论了同步脚本的性能。Discussed sync performance today.\n".encode() * (size // 80 + 1)
+    )
+    old = time.time() - 7200
+    files: list[Path] = []
+    for i in range(profile["files"]):
+        sub = root / "memory" / f"d{i // 100:03d}"
+        sub.mkdir(parents=True, exist_ok=True)
+        if kind == "journal":
+            path = sub / f"2026-02-{i % 28 + 1:02d}-{i:04d}.md"
+        else:
+            path = sub / f"{i:06d}.{'bin' if kind == 'binary' else 'md'}"
+        header = f"# {i}\n".encode()
+        path.write_bytes(header + (block * (size // len(block) + 1))[: size - len(header)])
+        os.utime(path, (old, old))
+        files.append(path)
+    return files
+
+
+def mutate_files(paths: list[Path], kind: str, rep: int) -> None:
+    """
+    修改文件：日志文件追加一行（大小变化），其他文件原地改写开头（大小不变，必须重新哈希）。
+    mtime 设为过去的时间，避开哈希清单的 racy 窗口，使之后的无变化运行能命中清单。
+    """
+    stamp = time.time() - 3600 + rep
+    for path in paths:
+        if kind == "journal":
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(f"- bench entry {rep}\n")
+        else:
+            with open(path, "r+b") as f:
+                f.write(f"{rep:08d}".encode())
+        os.utime(path, (stamp, stamp))
+
+
+def git(args: list[str], cwd: Path) -> str:
+    return subprocess.run(
+        ["git", *args], cwd=cwd, check=True, capture_output=True, text=True
+    ).stdout.strip()
+
+
+def setup_repo(root: Path) -> Path:
+    """建立本地 bare 远端与一个克隆，返回克隆路径（main 分支已推送）。"""
+    remote = root / "remote.git"
+    repo = root / "repo"
+    git(["init", "-q", "--bare", "-b", "main", str(remote)], cwd=root)
+    git(["init", "-q", "-b", "main", str(repo)], cwd=root)
+    git(["config", "user.name", "bench"], cwd=repo)
+    git(["config", "user.email", "bench@localhost"], cwd=repo)
+    (repo / "README.md").write_text("bench\n", encoding="utf-8")
+    git(["add", "README.md"], cwd=repo)
+    git(["commit", "-q", "-m", "init"], cwd=repo)
+    git(["remote", "add", "origin", str(remote)], cwd=repo)
+    git(["push", "-q", "-u", "origin", "main"], cwd=repo)
+    return repo
+
+
+def timed(func: Callable[[], Any]) -> tuple[float, Any]:
+    t0 = time.perf_counter()
+    result = func()
+    return time.perf_counter() - t0, result
+
+
+def run_scenario(
+    config: dict[str, Any], repo: Path, workspace: Path, workers: int
+) -> dict[str, float]:
+    """在当前源/仓库状态上计时一次完整流程，结束时仓库与源保持一致。"""
+    results: dict[str, float] = {}
+
+    def hash_dir() -> str:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return openclaw_sync.calculate_dir_hash(workspace / "memory", executor=pool)
+
+    results["hash_dir"], _ = timed(hash_dir)
+
+    # private_index：与 HEAD 的树比较并构造提交（不推送、不触碰工作区）
+    def private_index() -> str | None:
+        head = git(["rev-parse", "HEAD"], cwd=repo)
+        staged: list[openclaw_sync.StagedChange] = []
+        synced = openclaw_sync.sync_items(config, workers=workers, base_commit=head, staged=staged)
+        if not synced:
+            return None
+        return openclaw_sync.commit_with_private_index(
+            repo, head, staged, "bench", repo / "logs" / "bench.index"
+        )
+
+    results["private_index"], _ = timed(private_index)
+
+    # checkout 模式：复制到工作区，再 add/commit/push 到本地 bare 远端
+    results["sync_items"], synced = timed(lambda: openclaw_sync.sync_items(config, workers=workers))
+
+    def commit_push() -> None:
+        if openclaw_sync.commit_changes(repo, "[bench] sync", synced or ["memory/"]):
+            openclaw_sync.push_branch(repo, "main")
+
+    results["commit_push"], _ = timed(commit_push)
+    return results
+
+
+def bench_profile(name: str, profile: dict[str, Any], workers: int, repeat: int) -> dict[str, float]:
+    """对单个 profile 跑全部场景，返回 {"<场景>/<指标>": 最快耗时}。"""
+    results: dict[str, float] = {}
+    with tempfile.TemporaryDirectory(prefix=f"openclaw_bench_{name}_") as tmp:
+        root = Path(tmp)
+        workspace = root / "workspace"
+        files = make_profile_workspace(workspace, profile)
+        repo = setup_repo(root)
+        # sync_items 以 PROJECT_ROOT 定位 personas/ 与日志目录：指向临时克隆
+        openclaw_sync.PROJECT_ROOT = repo
+        config = {
+            "source_dir": str(workspace),
+            "target_subdir": "bench",
+            "sync_items": ["memory/"],
+            "logging": {"log_dir": "logs"},
+            "performance": {"workers": workers},
+        }
+        (repo / ".gitignore").write_text("/logs/\n", encoding="utf-8")
+
+        # 首次同步不计时：建立目标端、提交并预热哈希清单
+        openclaw_sync.sync_items(config, workers=workers)
+        openclaw_sync.commit_changes(repo, "[bench] initial", ["memory/"])
+        openclaw_sync.push_branch(repo, "main")
+        openclaw_sync.sync_items(config, workers=workers)
+
+        n_many = max(1, int(len(files) * MANY_FILES_FRACTION))
+        rep = 0
+        for scenario in SCENARIOS:
+            for _ in range(repeat):
+                rep += 1
+                if scenario == "one-file":
+                    mutate_files(files[len(files) // 2 : len(files) // 2 + 1], profile["kind"], rep)
+                elif scenario == "many-files":
+                    step = len(files) // n_many
+                    mutate_files(files[::step][:n_many], profile["kind"], rep)
+                for metric, seconds in run_scenario(config, repo, workspace, workers).items():
+                    key = f"{scenario}/{metric}"
+                    results[key] = min(results.get(key, float("inf")), seconds)
+    return results
+
+
+def compare_to_baseline(
+    current: dict[str, float], baseline: dict[str, float], threshold: float
+) -> list[str]:
+    """返回超出回归阈值的指标说明列表。"""
+    regressions: list[str] = []
+    for key, seconds in sorted(current.items()):
+        base = baseline.get(key)
+        if base is None:
+            continue
+        if seconds > base * (1 + threshold) and seconds - base > NOISE_FLOOR_SECONDS:
+            regressions.append(f"{key}: {base * 1000:.1f} ms → {seconds * 1000:.1f} ms (+{(seconds / base - 1) * 100:.0f}%)")
+    return regressions
+
+
+def print_results(results: dict[str, float], baseline: dict[str, float]) -> None:
+    header = f"{'profile / scenario':<26}" + "".join(f"{m:>16}" for m in METRICS)
+    print(header)
+    print("-" * len(header))
+    for prefix in sorted({key.rsplit("/", 1)[0] for key in results}, key=lambda k: list(results).index(f"{k}/{METRICS[0]}")):
+        cells = []
+        for metric in METRICS:
+            key = f"{prefix}/{metric}"
+            cell = f"{results[key] * 1000:.1f} ms"
+            if key in baseline and baseline[key] > 0:
+                cell += f" {(results[key] / baseline[key] - 1) * 100:+.0f}%"
+            cells.append(f"{cell:>16}")
+        print(f"{prefix:<26}" + "".join(cells))
+
+
+def run_suite(args: argparse.Namespace) -> int:
+    profile_names = [p.strip() for p in args.profiles.split(",") if p.strip()]
+    unknown = [p for p in profile_names if p not in PROFILES]
+    if unknown:
+        print(f"Unknown profile(s): {', '.join(unknown)} (available: {', '.join(PROFILES)})", file=sys.stderr)
+        return 2
+    workers = max(int(w) for w in args.workers.split(",") if w.strip())
+
+    # 只保留警告：基准测试输出以结果表为主
+    openclaw_sync.logger.remove()
+    openclaw_sync.logger.add(sys.stderr, level="WARNING")
+
+    results: dict[str, float] = {}
+    for name in profile_names:
+        profile = PROFILES[name]
+        print(
+            f"Running {name}: {profile['files']} {profile['kind']} file(s) × "
+            f"{openclaw_sync.format_bytes(profile['size'])} …",
+            file=sys.stderr,
+        )
+        for key, seconds in bench_profile(name, profile, workers, args.repeat).items():
+            results[f"{name}/{key}"] = round(seconds, 6)
+
+    baseline: dict[str, float] = {}
+    if args.baseline.exists() and not args.update_baseline:
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8")).get("results", {})
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "workers": workers,
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    print_results(results, baseline)
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+        print(f"\nResults written to {args.output}")
+
+    if not baseline:
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+        print(f"\nBaseline written to {args.baseline}")
+        return 0
+
+    regressions = compare_to_baseline(results, baseline, args.threshold)
+    if regressions:
+        print(f"\nREGRESSION (threshold {args.threshold:.0%}):", file=sys.stderr)
+        for line in regressions:
+            print(f"  {line}", file=sys.stderr)
+        return 1
+    print(f"\nNo regressions beyond {args.threshold:.0%} against {args.baseline}")
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark openclaw_sync hashing throughput and sync scenarios")
+    parser.add_argument("--files", type=int, default=400, help="Number of synthetic files (default: 400)")
+    parser.add_argument("--size", type=int, default=256 * 1024, help="Bytes per file (default: 262144)")
+    parser.add_argument(
+        "--workers",
+        default="1,2,4",
+        help="Comma-separated worker counts (default: 1,2,4); --suite uses the largest",
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="Repetitions per measurement, best is kept")
+    parser.add_argument("--suite", action="store_true", help="Run the scenario suite instead of the hash sweep")
+    parser.add_argument(
+        "--profiles",
+        default=DEFAULT_PROFILES,
+        help=f"Suite: comma-separated workspace profiles (default: {DEFAULT_PROFILES}; available: {', '.join(PROFILES)})",
+    )
+    parser.add_argument(
+        "--baseline",
+        type=Path,
+        default=DEFAULT_BASELINE,
+        help="Suite: baseline JSON to compare against; created if missing",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help=f"Suite: fail when a timing exceeds the baseline by this fraction (default: {DEFAULT_THRESHOLD})",
+    )
+    parser.add_argument("--update-baseline", action="store_true", help="Suite: overwrite the baseline with this run")
+    parser.add_argument("--output", type=Path, default=None, help="Suite: also write this run's results to PATH")
+    args = parser.parse_args()
+
+    if args.suite:
+        return run_suite(args)
+    return run_hash_throughput(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
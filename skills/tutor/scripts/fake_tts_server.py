@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the edge-tts websocket endpoint, for timing and offline testing
+of generate_audio.py without network access.
+
+Usage:
+    ~/.tutor-venv/bin/python fake_tts_server.py [--port 8765] [--latency 0.8] [--seconds-per-char 0.12]
+
+    python generate_audio.py narration.json out/ --tts-endpoint ws://127.0.0.1:8765/edge/v1
+
+Speaks the same protocol as speech.platform.bing.com: receives speech.config and
+SSML messages, answers with turn.start, audio chunks and turn.end. Word/sentence
+boundary metadata is sent when the client enables it. Audio is silent MPEG-2 Layer III
+(24 kHz, 48 kbit/s, mono) — the stream format edge-tts requests — lasting
+seconds-per-char × the number of spoken characters. Each request waits `latency`
+seconds before the first chunk to mimic the network round trip.
+
+Dependencies:
+    aiohttp (installed with edge-tts in ~/.tutor-venv)
+"""
+
+import argparse
+import asyncio
+import json
+import re
+from html import unescape
+
+from aiohttp import web
+
+# One silent frame: MPEG-2 Layer III, 48 kbit/s, 24 kHz, mono, no CRC → 144 bytes, 576 samples (24 ms)
+SILENT_FRAME = b"\xff\xf3\x64\xc0" + b"\x00" * 140
+FRAME_SECONDS = 576 / 24000
+TICKS_PER_SECOND = 10_000_000
+CHUNK_FRAMES = 40  # frames per binary message, roughly what the real service sends
+
+WORD_RE = re.compile(r"[A-Za-z0-9.']+|[一-鿿]")
+SENTENCE_RE = re.compile(r"[^。！？!?.]+[。！？!?.]?")
+
+
+def message(path: str, body: str = "", content_type: str = "application/json; charset=utf-8") -> str:
+    return f"X-RequestId:fake\r\nContent-Type:{content_type}\r\nPath:{path}\r\n\r\n{body}"
+
+
+def audio_message(data: bytes) -> bytes:
+    header = b"X-RequestId:fake\r\nContent-Type:audio/mpeg\r\nPath:audio"
+    # The length prefix counts itself: clients parse headers from message[:length]
+    return (len(header) + 2).to_bytes(2, "big") + header + b"\r\n" + data
+
+
+def boundary_message(kind: str, text: str, offset: float, duration: float) -> str:
+    data = {
+        "Offset": int(offset * TICKS_PER_SECOND),
+        "Duration": int(duration * TICKS_PER_SECOND),
+        "text": {"Text": text, "Length": len(text), "BoundaryType": kind},
+    }
+    return message("audio.metadata", json.dumps({"Metadata": [{"Type": kind, "Data": data}]}, ensure_ascii=False))
+
+
+def ssml_text(ssml: str) -> str:
+    m = re.search(r"<prosody[^>]*>(.*)</prosody>", ssml, re.S)
+    return unescape(m.group(1) if m else re.sub(r"<[^>]+>", "", ssml))
+
+
+async def handle(request: web.Request) -> web.WebSocketResponse:
+    opts = request.app["opts"]
+    ws = web.WebSocketResponse()
+    await ws.prepare(request)
+    word_boundary = False
+
+    async for msg in ws:
+        if msg.type != web.WSMsgType.TEXT:
+            continue
+        head, _, body = msg.data.partition("\r\n\r\n")
+        if "Path:speech.config" in head:
+            word_boundary = '"wordBoundaryEnabled":"true"' in body
+            continue
+        if "Path:ssml" not in head:
+            continue
+
+        text = ssml_text(body)
+        await asyncio.sleep(opts.latency)
+        await ws.send_str(message("turn.start", "{}"))
+
+        # Lay out the spoken units back to back, then emit metadata just before the audio covering it
+        units = WORD_RE.findall(text) if word_boundary else [s.strip() for s in SENTENCE_RE.findall(text) if s.strip()]
+        kind = "WordBoundary" if word_boundary else "SentenceBoundary"
+        offset = 0.1  # the service starts speaking after a short lead-in
+        for unit in units:
+            n_chars = len(unit) if re.match(r"[一-鿿]", unit) else max(1, len(unit) // 3)
+            duration = n_chars * opts.seconds_per_char
+            await ws.send_str(boundary_message(kind, unit, offset, duration))
+            offset += duration
+        n_frames = max(1, round((offset + 0.2) / FRAME_SECONDS))
+        for start in range(0, n_frames, CHUNK_FRAMES):
+            await ws.send_bytes(audio_message(SILENT_FRAME * min(CHUNK_FRAMES, n_frames - start)))
+            await asyncio.sleep(0)
+        await ws.send_str(message("turn.end", "{}"))
+    return ws
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake edge-tts websocket endpoint")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.8, help="Seconds before the first chunk of each request")
+    parser.add_argument("--seconds-per-char", type=float, default=0.12, help="Speech length per character")
+    opts = parser.parse_args()
+
+    app = web.Application()
+    app["opts"] = opts
+    app.router.add_get("/{tail:.*}", handle)
+    print(f"Fake TTS endpoint on ws://{opts.host}:{opts.port}/edge/v1 (latency {opts.latency}s)")
+    web.run_app(app, host=opts.host, port=opts.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,7 +3,23 @@
 Generate Chinese narration audio using edge-tts.
 
 Usage:
-    python generate_audio.py <narration_json> <output_dir>
+    python generate_audio.py <narration_json> <output_dir> [--concurrency N] [--timeout SECONDS]
+                             [--no-cache] [--tts-endpoint URL] [--compare]
+
+    Segments are split into sentences and each sentence is looked up in a persistent
+    cache (~/.cache/tutor-tts, keyed by text, VOICE, RATE and edge-tts version); only
+    cache misses are synthesized and the pieces are joined frame by frame, without
+    re-encoding. Audio is streamed to disk as it arrives, together with the word
+    boundary events edge-tts sends alongside it. The cache is kept under CACHE_MAX_BYTES by evicting the least
+    recently used sentences. --no-cache synthesizes whole segments and leaves the
+    cache untouched.
+
+    Requests run concurrently (at most --concurrency in flight, default 4); each
+    request is abandoned after --timeout seconds (default 60). combined.mp3 always
+    follows the order of narration_json.
+    --tts-endpoint points edge-tts at another websocket endpoint, e.g. the local
+    fake_tts_server.py; --compare runs the synthesis once sequentially and once
+    concurrently, both without the cache, and prints both wall times.
 
 narration_json format:
     [
@@ -17,14 +33,38 @@ Output:
     output_dir/intro.mp3
     output_dir/step1.mp3
     ...
-    output_dir/combined.mp3   (all segments merged in order)
+    output_dir/combined.mp3   (all segments merged in order, frame by frame without re-encoding)
+    output_dir/durations.json (per-segment durations and their offsets in combined.mp3)
+    output_dir/words.json     (when each spoken word starts and ends, per segment)
+    output_dir/combined.srt, output_dir/combined.vtt   (subtitles timed to combined.mp3)
+
+durations.json format:
+    {
+        "total": 31.104,
+        "combined": {"file": "combined.mp3", "duration": 31.104},
+        "segments": [
+            {"id": "intro", "file": "intro.mp3", "duration": 2.784, "start": 0.0, "end": 2.784},
+            {"id": "step1", "file": "step1.mp3", "duration": 3.528, "start": 2.784, "end": 6.312},
+            ...
+        ]
+    }
+
+words.json format (times in seconds from the start of the segment's own mp3;
+add the segment's "start" from durations.json for combined.mp3):
+    {
+        "segments": [
+            {"id": "intro", "words": [{"text": "同学", "start": 0.1, "end": 0.46}, ...]},
+            ...
+        ]
+    }
 
 Dependencies:
     edge-tts is auto-installed into ~/.tutor-venv on first run.
-    brew install ffmpeg  (for merging)
+    brew install ffmpeg  (only for merging segments whose stream parameters differ)
 """
 
 import os
+import re
 import sys
 import subprocess
 from pathlib import Path
@@ -32,6 +72,14 @@ from pathlib import Path
 VOICE = "zh-CN-XiaoxiaoNeural"   # Natural female Chinese voice
 RATE  = "+0%"                     # Speed adjustment, e.g. "+10%" to speed up
 
+CONCURRENCY = 4                   # Parallel TTS requests
+REQUEST_TIMEOUT = 60.0            # Seconds before a single TTS request is abandoned
+
+CACHE_DIR = Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache") / "tutor-tts"
+CACHE_MAX_BYTES = 256 * 1024 * 1024   # Least recently used sentences are evicted beyond this
+
+SUBTITLE_MAX_CHARS = 18           # Longer sentences are split into several cues at commas
+
 VENV_DIR = Path.home() / ".tutor-venv"
 
 
@@ -54,7 +102,7 @@ def ensure_venv():
         subprocess.run([sys.executable, "-m", "venv", str(VENV_DIR)], check=True)
         print("[tutor] Installing edge-tts …")
         subprocess.run(
-            [str(venv_python), "-m", "pip", "install", "--quiet", "edge-tts"],
+            [str(venv_python), "-m", "pip", "install", "--quiet", "edge-tts>=7.0"],
             check=True,
         )
         print("[tutor] edge-tts installed successfully.\n")
@@ -66,32 +114,406 @@ def ensure_venv():
 # Run venv bootstrap before any edge-tts imports
 ensure_venv()
 
+import argparse
 import json
 import asyncio
+import hashlib
+import time
+import unicodedata
 
 
-async def synthesize_segment(text: str, output_path: Path, voice: str, rate: str):
-    """Synthesize one narration segment using edge-tts."""
+def import_edge_tts():
     try:
         import edge_tts
     except ImportError:
         print("edge-tts not found even inside venv — try deleting ~/.tutor-venv and re-running.", file=sys.stderr)
         sys.exit(1)
+    return edge_tts
+
+
+def use_tts_endpoint(url: str):
+    """Send edge-tts requests to another websocket endpoint (e.g. fake_tts_server.py)."""
+    import_edge_tts()
+    import edge_tts.communicate
+
+    # edge-tts appends "&ConnectionId=…" to this URL, so it needs a query string
+    edge_tts.communicate.WSS_URL = url if "?" in url else f"{url}?TrustedClientToken=local"
+
+
+# ── MP3 frames ───────────────────────────────────────────────────────────────
+
+# Layer III only — the only layer edge-tts produces
+MP3_BITRATES = {
+    "1": [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    "2": [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+MP3_SAMPLE_RATES = {"1": [44100, 48000, 32000], "2": [22050, 24000, 16000], "2.5": [11025, 12000, 8000]}
+MP3_VERSIONS = {0b11: "1", 0b10: "2", 0b00: "2.5"}
+
+
+def parse_frame_header(data: bytes, pos: int):
+    """
+    Decode the 4-byte MPEG audio frame header at `pos`.
+    Returns (version, bitrate kbit/s, sample rate, channels, frame length, samples) or None.
+    """
+    if pos + 4 > len(data) or data[pos] != 0xFF or data[pos + 1] & 0xE0 != 0xE0:
+        return None
+    b1, b2, b3 = data[pos + 1], data[pos + 2], data[pos + 3]
+    version = MP3_VERSIONS.get((b1 >> 3) & 0b11)
+    layer = (b1 >> 1) & 0b11
+    bitrate_index, rate_index = b2 >> 4, (b2 >> 2) & 0b11
+    if version is None or layer != 0b01 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    bitrate = MP3_BITRATES["1" if version == "1" else "2"][bitrate_index]
+    sample_rate = MP3_SAMPLE_RATES[version][rate_index]
+    padding = (b2 >> 1) & 1
+    channels = 1 if b3 >> 6 == 0b11 else 2
+    samples = 1152 if version == "1" else 576
+    length = samples // 8 * bitrate * 1000 // sample_rate + padding
+    return version, bitrate, sample_rate, channels, length, samples
+
+
+def id3v2_size(data: bytes) -> int:
+    """Length of a leading ID3v2 tag (0 if there is none)."""
+    if len(data) < 10 or data[:3] != b"ID3":
+        return 0
+    size = (data[6] & 0x7F) << 21 | (data[7] & 0x7F) << 14 | (data[8] & 0x7F) << 7 | (data[9] & 0x7F)
+    return 10 + size + (10 if data[5] & 0x10 else 0)
+
+
+def info_tag_offset(data: bytes, pos: int, header) -> int | None:
+    """Offset of a Xing/Info or VBRI tag inside the frame at `pos`, if that frame carries one."""
+    version, _, _, channels, length, _ = header
+    side_info = (17 if channels == 1 else 32) if version == "1" else (9 if channels == 1 else 17)
+    for offset in (pos + 4 + side_info, pos + 36):
+        if data[offset:offset + 4] in (b"Xing", b"Info", b"VBRI") and offset + 4 <= pos + length:
+            return offset
+    return None
+
+
+def mp3_frames(data: bytes) -> list:
+    """
+    Locate the audio frames of an MP3 file: [(offset, header), ...].
+    Skips ID3v2 tags, the Xing/Info/VBRI frame and trailing ID3v1/APE tags; after junk
+    it resynchronises on a header that is followed by another valid header.
+    """
+    frames = []
+    pos = id3v2_size(data)
+    while pos + 4 <= len(data):
+        header = parse_frame_header(data, pos)
+        if header is None or pos + header[4] > len(data):
+            nxt = data.find(b"\xff", pos + 1)
+            while nxt != -1:
+                h = parse_frame_header(data, nxt)
+                if h and (nxt + h[4] == len(data) or parse_frame_header(data, nxt + h[4])):
+                    break
+                nxt = data.find(b"\xff", nxt + 1)
+            if nxt == -1:
+                break
+            pos = nxt
+            continue
+        if frames or info_tag_offset(data, pos, header) is None:
+            frames.append((pos, header))
+        pos += header[4]
+    return frames
+
+
+def mp3_duration(data: bytes) -> float:
+    """
+    Playing time of an MP3 file in seconds, without decoding. Uses the frame count of a
+    Xing/Info or VBRI tag when the file has one, otherwise counts the frames.
+    """
+    pos = id3v2_size(data)
+    header = parse_frame_header(data, pos)
+    if header is not None:
+        samples, sample_rate = header[5], header[2]
+        offset = info_tag_offset(data, pos, header)
+        if offset is not None and data[offset:offset + 4] == b"VBRI":
+            return int.from_bytes(data[offset + 14:offset + 18], "big") * samples / sample_rate
+        if offset is not None and int.from_bytes(data[offset + 4:offset + 8], "big") & 0x1:
+            return int.from_bytes(data[offset + 8:offset + 12], "big") * samples / sample_rate
+    frames = mp3_frames(data)
+    # Count samples rather than adding per-frame seconds, so the result carries no rounding drift
+    return sum(h[5] for _, h in frames) / frames[0][1][2] if frames else 0.0
+
+
+def join_mp3(parts: list) -> bytes:
+    """Concatenate MP3 streams frame by frame, dropping per-file tags and Info frames."""
+    return b"".join(
+        data[pos:pos + header[4]]
+        for data in parts
+        for pos, header in mp3_frames(data)
+    )
+
+
+def info_frame(template: bytes, frames: list) -> bytes:
+    """
+    Build a Xing/Info frame describing `frames` ([(header bytes, length), ...]) for the start
+    of a file. `template` is the 4-byte header of the first audio frame; the tag is "Info"
+    for a constant bitrate stream and "Xing" otherwise.
+    """
+    version = MP3_VERSIONS[(template[1] >> 3) & 0b11]
+    mono = template[3] >> 6 == 0b11
+    side_info = (17 if mono else 32) if version == "1" else (9 if mono else 17)
+    tag_size = 4 + side_info + 4 + 4 + 4 + 4 + 100   # header, side info, tag, flags, frames, bytes, TOC
+
+    # Same stream parameters as the audio, no CRC, no padding; the audio's bitrate unless the tag needs more room
+    for bitrate_index in range(template[2] >> 4, 15):
+        header = bytes([0xFF, template[1] | 0x01, (template[2] & 0x0C) | bitrate_index << 4, template[3]])
+        length = parse_frame_header(header, 0)[4]
+        if length >= tag_size:
+            break
+
+    lengths = [n for _, n in frames]
+    total_bytes = length + sum(lengths)
+    offsets = [length]
+    for n in lengths[:-1]:
+        offsets.append(offsets[-1] + n)
+    toc = bytes(
+        min(255, offsets[i * len(frames) // 100] * 256 // total_bytes) if frames else 0
+        for i in range(100)
+    )
+    cbr = len({h[2] >> 4 for h, _ in frames}) <= 1
+    tag = (b"Info" if cbr else b"Xing") + (0x7).to_bytes(4, "big") \
+        + len(frames).to_bytes(4, "big") + total_bytes.to_bytes(4, "big") + toc
+    body = header + bytes(side_info) + tag
+    return body + bytes(length - len(body))
+
+
+def concat_mp3(parts: list) -> bytes | None:
+    """
+    Join complete MP3 files into one without re-encoding: per-file ID3 tags and
+    Xing/Info/VBRI frames are dropped, the audio frames appended in order and a new
+    Info frame written in front. Returns None if the files differ in MPEG version,
+    sample rate or channel count, which a plain frame append cannot reconcile.
+    """
+    frames = []
+    params = set()
+    for data in parts:
+        for pos, header in mp3_frames(data):
+            params.add((header[0], header[2], header[3]))
+            frames.append((data[pos:pos + 4], data[pos:pos + header[4]]))
+    if len(params) != 1:
+        return None
+    return info_frame(frames[0][0], [(h, len(f)) for h, f in frames]) + b"".join(f for _, f in frames)
+
+
+# ── Sentence cache ───────────────────────────────────────────────────────────
+
+# A sentence runs up to its closing punctuation (plus any closing quotes/brackets);
+# "." is left alone so decimals such as 3.14 stay in one piece
+SENTENCE_RE = re.compile(r"[^。！？；!?;\n]+(?:[。！？；!?;]+[”’」』）)\"']*)?")
+
+
+def normalize_text(text: str) -> str:
+    """Canonical form used for synthesis and cache keys: NFC, whitespace collapsed."""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFC", text)).strip()
+
 
-    communicate = edge_tts.Communicate(text, voice, rate=rate)
-    await communicate.save(str(output_path))
+def split_sentences(text: str) -> list:
+    sentences = [normalize_text(s) for s in SENTENCE_RE.findall(text)]
+    return [s for s in sentences if s] or [normalize_text(text)]
+
+
+class SentenceCache:
+    """
+    Synthesized sentences stored as <root>/<key[:2]>/<key>.mp3 with their word timings
+    in <key>.words.json, where key hashes the sentence, voice, rate and engine version.
+    An mp3's mtime is its last use, so eviction removes the oldest entries first.
+    """
+
+    def __init__(self, root: Path, max_bytes: int, engine: str, enabled: bool = True):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.engine = engine
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, sentence: str) -> str:
+        material = json.dumps([self.engine, VOICE, RATE, sentence], ensure_ascii=False)
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.mp3"
+
+    def words_path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.words.json"
+
+    def get(self, key: str):
+        """Cached (mp3 bytes, words) for a sentence, or None. Entries without timings count as misses."""
+        if not self.enabled:
+            return None
+        path = self.path(key)
+        try:
+            words = json.loads(self.words_path(key).read_text(encoding="utf-8"))
+            data = path.read_bytes()
+            os.utime(path)
+        except (FileNotFoundError, ValueError):
+            return None
+        return data, words
+
+    def put_words(self, key: str, words: list):
+        """Record the timings of a sentence whose audio was just streamed to path(key)."""
+        path = self.words_path(key)
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}.part")
+        tmp_path.write_text(json.dumps(words, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp_path, path)
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits. Returns (evicted, bytes kept)."""
+        if not self.enabled or not self.root.is_dir():
+            return 0, 0
+        entries = []
+        for path in self.root.glob("*/*.mp3"):
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        evicted = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            self.words_path(path.stem).unlink(missing_ok=True)
+            total -= size
+            evicted += 1
+        return evicted, total
+
+
+# ── Synthesis ────────────────────────────────────────────────────────────────
+
+TICKS_PER_SECOND = 10_000_000     # edge-tts offsets and durations are in 100 ns units
+
+
+async def synthesize_to(text: str, output_path: Path, voice: str, rate: str) -> list:
+    """
+    Synthesize one piece of text with edge-tts, writing the audio to `output_path` as it
+    streams in. Returns the word boundaries: [{"text", "start", "end"}, ...] in seconds.
+    """
+    edge_tts = import_edge_tts()
+    try:
+        communicate = edge_tts.Communicate(text, voice, rate=rate, boundary="WordBoundary")
+    except TypeError:
+        # edge-tts < 7 has no `boundary` argument but streams WordBoundary events by default
+        communicate = edge_tts.Communicate(text, voice, rate=rate)
+    words = []
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    # Stream into a temp file and rename, so an abandoned request never leaves a truncated mp3
+    tmp_path = output_path.with_name(f".{output_path.name}.{os.getpid()}.part")
+    try:
+        with open(tmp_path, "wb") as f:
+            async for chunk in communicate.stream():
+                if chunk["type"] == "audio":
+                    f.write(chunk["data"])
+                elif chunk["type"] == "WordBoundary":
+                    start = chunk["offset"] / TICKS_PER_SECOND
+                    words.append({"text": chunk["text"], "start": round(start, 3),
+                                  "end": round(start + chunk["duration"] / TICKS_PER_SECOND, 3)})
+        os.replace(tmp_path, output_path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+    return words
+
+
+async def synthesize_all(segments: list, output_dir: Path, concurrency: int, timeout: float,
+                         cache: SentenceCache):
+    """
+    Synthesize all segments with at most `concurrency` TTS requests in flight.
+    With the cache enabled each segment is assembled from per-sentence audio; a
+    sentence is synthesized once per run however many segments use it.
+    Returns (audio_files in narration order, per-segment seconds, wall seconds,
+    per-segment sentence timings as [(text, start, duration, words), ...]).
+    Exits if any segment fails or times out.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    sentences: dict = {}   # cache key → task producing (sentence audio, words)
+
+    async def load_or_synthesize(key: str, sentence: str):
+        cached = cache.get(key)
+        if cached is not None:
+            cache.hits += 1
+            return cached
+        cache.misses += 1
+        # Without the cache the audio only passes through a scratch file in output_dir
+        target = cache.path(key) if cache.enabled else output_dir / f".{key}.mp3"
+        async with semaphore:
+            words = await asyncio.wait_for(synthesize_to(sentence, target, VOICE, RATE), timeout)
+        data = target.read_bytes()
+        if cache.enabled:
+            cache.put_words(key, words)
+        else:
+            target.unlink()
+        return data, words
+
+    def sentence_audio(sentence: str):
+        key = cache.key(sentence)
+        if key in sentences:
+            cache.hits += 1
+        else:
+            sentences[key] = asyncio.ensure_future(load_or_synthesize(key, sentence))
+        return sentences[key]
+
+    async def run_one(seg: dict):
+        started = time.perf_counter()
+        text = seg["text"]
+        units = split_sentences(text) if cache.enabled else [normalize_text(text)]
+        parts = await asyncio.gather(*(sentence_audio(u) for u in units), return_exceptions=True)
+        for part in parts:
+            if isinstance(part, BaseException):
+                raise part
+
+        out_path = output_dir / f"{seg['id']}.mp3"
+        # Write next to the target and rename, so a failed run never leaves a truncated mp3
+        tmp_path = out_path.with_name(f".{out_path.name}.part")
+        tmp_path.write_bytes(join_mp3([data for data, _ in parts]) if len(parts) > 1 else parts[0][0])
+        os.replace(tmp_path, out_path)
+
+        # Sentence word timings are relative to the sentence; shift them by the audio before it
+        timing = []
+        offset = 0.0
+        for unit, (data, words) in zip(units, parts):
+            duration = mp3_duration(data)
+            shifted = [{**w, "start": round(w["start"] + offset, 3), "end": round(w["end"] + offset, 3)}
+                       for w in words]
+            timing.append((unit, offset, duration, shifted))
+            offset += duration
+
+        elapsed = time.perf_counter() - started
+        print(f"  [{seg['id']}] {elapsed:5.2f}s  {text[:40]}{'...' if len(text) > 40 else ''}")
+        return out_path, elapsed, timing
+
+    wall_start = time.perf_counter()
+    results = await asyncio.gather(*(run_one(seg) for seg in segments), return_exceptions=True)
+    wall = time.perf_counter() - wall_start
+
+    failed = [(seg["id"], r) for seg, r in zip(segments, results) if isinstance(r, BaseException)]
+    for seg_id, error in failed:
+        reason = f"timed out after {timeout:g}s" if isinstance(error, asyncio.TimeoutError) else f"{type(error).__name__}: {error}"
+        print(f"  [{seg_id}] synthesis failed — {reason}", file=sys.stderr)
+    if failed:
+        sys.exit(1)
+    return [r[0] for r in results], [r[1] for r in results], wall, [r[2] for r in results]
 
 
 def merge_audio_files(audio_files: list, output_path: Path):
-    """Merge audio segments in order using ffmpeg."""
+    """
+    Merge audio segments in order. Segments from the same voice share their stream
+    parameters and are joined frame by frame; otherwise ffmpeg re-encodes them.
+    """
     if not audio_files:
         return
 
-    if len(audio_files) == 1:
-        import shutil
-        shutil.copy(audio_files[0], output_path)
+    merged = concat_mp3([p.read_bytes() for p in audio_files])
+    if merged is not None:
+        tmp_path = output_path.with_name(f".{output_path.name}.part")
+        tmp_path.write_bytes(merged)
+        os.replace(tmp_path, output_path)
         return
 
+    print("  Segments differ in sample rate or channels — re-encoding with ffmpeg")
     # Build ffmpeg concat list
     list_file = output_path.parent / "_concat_list.txt"
     with open(list_file, "w", encoding="utf-8") as f:
@@ -110,44 +532,180 @@ def merge_audio_files(audio_files: list, output_path: Path):
         sys.exit(1)
 
 
-async def main():
-    if len(sys.argv) < 3:
-        print("Usage: generate_audio.py <narration_json> <output_dir>")
-        sys.exit(1)
+def write_durations(segments: list, audio_files: list, combined: Path) -> dict:
+    """Write durations.json next to the audio: segment durations and offsets in combined.mp3."""
+    entries = []
+    start = 0.0
+    for seg, path in zip(segments, audio_files):
+        duration = round(mp3_duration(path.read_bytes()), 3)
+        entries.append({"id": seg["id"], "file": path.name, "duration": duration,
+                        "start": round(start, 3), "end": round(start + duration, 3)})
+        start += duration
+    manifest = {"total": round(start, 3)}
+    if combined.exists():
+        manifest["combined"] = {"file": combined.name, "duration": round(mp3_duration(combined.read_bytes()), 3)}
+    manifest["segments"] = entries
 
-    narration_path = Path(sys.argv[1])
-    output_dir = Path(sys.argv[2])
-    output_dir.mkdir(parents=True, exist_ok=True)
+    out_path = combined.parent / "durations.json"
+    tmp_path = out_path.with_name(f".{out_path.name}.part")
+    tmp_path.write_text(json.dumps(manifest, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+    os.replace(tmp_path, out_path)
+    return manifest
+
+
+# ── Word timings and subtitles ───────────────────────────────────────────────
+
+CLAUSE_RE = re.compile(r"[^，、,：:]+[，、,：:]*")
+
+
+def spoken_length(text: str) -> int:
+    """Characters that are read out (letters, digits, CJK) — what word boundaries cover."""
+    return sum(c.isalnum() for c in text)
+
+
+def subtitle_cues(text: str, start: float, duration: float, words: list) -> list:
+    """
+    Subtitle cues [(start, end, text), ...] for a piece of synthesized text: one per
+    sentence, with sentences longer than SUBTITLE_MAX_CHARS split at commas; each cue
+    is timed by the words it contains.
+    """
+    clauses = []
+    for sentence in SENTENCE_RE.findall(text) or [text]:
+        first = True
+        for clause in CLAUSE_RE.findall(sentence) or [sentence]:
+            if not first and len(clauses[-1] + clause) <= SUBTITLE_MAX_CHARS:
+                clauses[-1] += clause
+            else:
+                clauses.append(clause)
+            first = False
+    if not words:
+        return [(start, start + duration, text)]
+
+    cues = []
+    pending = ""   # clause text whose words were not found, carried into the next cue
+    remaining = list(words)
+    for i, clause in enumerate(clauses):
+        if i == len(clauses) - 1:
+            taken, remaining = remaining, []
+        else:
+            need, n = spoken_length(clause), 0
+            while n < len(remaining) and need > 0:
+                need -= spoken_length(remaining[n]["text"])
+                n += 1
+            taken, remaining = remaining[:n], remaining[n:]
+        if not taken:
+            pending += clause
+            continue
+        cues.append((taken[0]["start"], taken[-1]["end"], pending + clause))
+        pending = ""
+    if pending and cues:
+        cues[-1] = (cues[-1][0], cues[-1][1], cues[-1][2] + pending)
+    return cues
+
+
+def format_timestamp(seconds: float, separator: str) -> str:
+    ms = round(seconds * 1000)
+    return f"{ms // 3_600_000:02d}:{ms // 60_000 % 60:02d}:{ms // 1000 % 60:02d}{separator}{ms % 1000:03d}"
+
+
+def write_timings(segments: list, timings: list, durations: dict, output_dir: Path):
+    """Write words.json and combined.srt / combined.vtt from the per-segment sentence timings."""
+    words_manifest = {"segments": [
+        {"id": seg["id"], "words": [w for _, _, _, words in timing for w in words]}
+        for seg, timing in zip(segments, timings)
+    ]}
+
+    cues = []
+    for entry, timing in zip(durations["segments"], timings):
+        for text, start, duration, words in timing:
+            for cue_start, cue_end, cue_text in subtitle_cues(text, start, duration, words):
+                cue_text = cue_text.strip().rstrip("，、,：:；;。")
+                if cue_text:
+                    cues.append((entry["start"] + cue_start, entry["start"] + cue_end, cue_text))
+
+    srt = "".join(
+        f"{i}\n{format_timestamp(a, ',')} --> {format_timestamp(b, ',')}\n{text}\n\n"
+        for i, (a, b, text) in enumerate(cues, 1)
+    )
+    vtt = "WEBVTT\n\n" + "".join(
+        f"{format_timestamp(a, '.')} --> {format_timestamp(b, '.')}\n{text}\n\n" for a, b, text in cues
+    )
+    for name, content in (("words.json", json.dumps(words_manifest, ensure_ascii=False, indent=2) + "\n"),
+                          ("combined.srt", srt), ("combined.vtt", vtt)):
+        out_path = output_dir / name
+        tmp_path = out_path.with_name(f".{out_path.name}.part")
+        tmp_path.write_text(content, encoding="utf-8")
+        os.replace(tmp_path, out_path)
+    return len(cues)
 
-    with open(narration_path, encoding="utf-8") as f:
-        segments = json.load(f)
 
-    print(f"Generating {len(segments)} audio segment(s) with voice '{VOICE}'...")
-    audio_files = []
+async def main():
+    parser = argparse.ArgumentParser(description="Generate Chinese narration audio using edge-tts")
+    parser.add_argument("narration_json", type=Path)
+    parser.add_argument("output_dir", type=Path)
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY,
+                        help=f"Parallel TTS requests (default: {CONCURRENCY})")
+    parser.add_argument("--timeout", type=float, default=REQUEST_TIMEOUT,
+                        help=f"Seconds per TTS request (one sentence when cached) before giving up (default: {REQUEST_TIMEOUT:.0f})")
+    parser.add_argument("--tts-endpoint", default=os.environ.get("TUTOR_TTS_ENDPOINT"),
+                        help="Websocket endpoint to use instead of the edge-tts service")
+    parser.add_argument("--no-cache", action="store_true",
+                        help=f"Synthesize whole segments without the sentence cache ({CACHE_DIR})")
+    parser.add_argument("--compare", action="store_true",
+                        help="Run sequentially and then concurrently, both without the cache, and print both wall times")
+    args = parser.parse_args()
+
+    output_dir = args.output_dir
+    output_dir.mkdir(parents=True, exist_ok=True)
+    if args.tts_endpoint:
+        use_tts_endpoint(args.tts_endpoint)
 
-    for seg in segments:
-        seg_id = seg["id"]
-        text   = seg["text"]
-        out_path = output_dir / f"{seg_id}.mp3"
+    with open(args.narration_json, encoding="utf-8") as f:
+        segments = json.load(f)
 
-        print(f"  [{seg_id}] {text[:40]}{'...' if len(text) > 40 else ''}")
-        await synthesize_segment(text, out_path, VOICE, RATE)
-        audio_files.append(out_path)
+    engine = f"edge-tts {import_edge_tts().__version__}"
+    use_cache = not (args.no_cache or args.compare)
+    cache = SentenceCache(CACHE_DIR, CACHE_MAX_BYTES, engine, enabled=use_cache)
+
+    sequential_wall = None
+    if args.compare:
+        print(f"Generating {len(segments)} audio segment(s) sequentially (for comparison)...")
+        _, _, sequential_wall, _ = await synthesize_all(segments, output_dir, 1, args.timeout, cache)
+
+    print(f"Generating {len(segments)} audio segment(s) with voice '{VOICE}' "
+          f"(concurrency {args.concurrency})...")
+    cache.hits = cache.misses = 0
+    audio_files, seconds, wall, timings = await synthesize_all(
+        segments, output_dir, args.concurrency, args.timeout, cache)
+
+    print("\nTiming summary:")
+    if sequential_wall is not None:
+        print(f"  sequential wall time  : {sequential_wall:.2f}s")
+        print(f"  concurrent wall time  : {wall:.2f}s  ({sequential_wall / wall:.1f}x faster, concurrency {args.concurrency})")
+    else:
+        print(f"  wall time             : {wall:.2f}s  (concurrency {args.concurrency})")
+        print(f"  sum of segment times  : {sum(seconds):.2f}s")
+    if cache.enabled:
+        evicted, kept = cache.evict()
+        lookups = cache.hits + cache.misses
+        print(f"  sentence cache        : {cache.hits}/{lookups} hit(s), {cache.misses} synthesized, "
+              f"{kept / 1024 / 1024:.1f} MiB in {CACHE_DIR}"
+              + (f", {evicted} evicted" if evicted else ""))
 
     combined = output_dir / "combined.mp3"
     print(f"\nMerging segments → {combined}")
     merge_audio_files(audio_files, combined)
 
+    manifest = write_durations(segments, audio_files, combined)
+    n_cues = write_timings(segments, timings, manifest, output_dir)
     print("Done. Audio files saved to:", output_dir)
-    # Print durations so the video synthesizer can time slides
-    for p in audio_files:
-        result = subprocess.run(
-            ["ffprobe", "-v", "error", "-show_entries", "format=duration",
-             "-of", "default=noprint_wrappers=1:nokey=1", str(p)],
-            capture_output=True, text=True
-        )
-        dur = result.stdout.strip()
-        print(f"  {p.name}: {dur}s")
+    # Print durations so the video synthesizer can time slides; durations.json has the same data
+    for entry in manifest["segments"]:
+        print(f"  {entry['file']}: {entry['duration']:.3f}s  (starts at {entry['start']:.3f}s)")
+    print(f"  total: {manifest['total']:.3f}s  → {output_dir / 'durations.json'}")
+    n_words = sum(len(words) for timing in timings for _, _, _, words in timing)
+    print(f"  {n_words} word timing(s) → {output_dir / 'words.json'}, "
+          f"{n_cues} subtitle cue(s) → combined.srt / combined.vtt")
 
 
 if __name__ == "__main__":